@@ -1,52 +1,686 @@
-import pandas as pd
+import argparse
+import glob
+import hashlib
+import heapq
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
+import openpyxl
+import pandas as pd
+
+try:
+    import pyarrow  # The sheet cache stores Feather files
+except ImportError:
+    pyarrow = None
 
 # Read the Excel file
 excel_file = 'data/Class Alternative GDP Index.xlsx'
+output_file = 'data/average_rankings.csv'
+cache_dir = 'data/.rankings_cache'
+
+LONG_COLUMNS = ['Sheet', 'Block', 'Index Name', 'Country', 'Index Score']
+CSV_COLUMNS = ['Rank', 'Country', 'Average Index Score', 'Number of Rankings']
+
+# Each team's ranking is a block of 'Index Name', 'Country' and 'Index Score' columns.
+# A sheet may hold several blocks side by side; pandas suffixes the repeated headers
+# ('Country', 'Country.1', ...), and the suffix says which block a column belongs to.
+BLOCK_COLUMN = re.compile(r'^(Index Name|Country|Index Score)(\.\d+)?$')
+
+
+def team_blocks(header):
+    """Group a sheet's header into team blocks.
+
+    `header` is the sheet's column names as pandas reads them (repeated names suffixed
+    '.1', '.2', ...). Returns one {field: column} dict per block that has at least a
+    Country and an Index Score column, in sheet order.
+    """
+    blocks = {}
+    for column in header:
+        match = BLOCK_COLUMN.match(str(column))
+        if match:
+            blocks.setdefault(match.group(2) or '', {})[match.group(1)] = column
+    return [columns for columns in blocks.values() if 'Country' in columns and 'Index Score' in columns]
+
+
+def sheet_blocks(df, sheet):
+    """Reshape every team block of one sheet into long rows.
+
+    Returns a frame with one row per ranked country: Sheet, Block, Index Name, Country
+    and Index Score. The team name is only filled in on a block's first row, so it is
+    carried down the block. Rows come in sheet order (row by row, blocks left to right),
+    the order a row iterator over the sheet sees them.
+    """
+    frames = []
+    for number, columns in enumerate(team_blocks(df.columns)):
+        block = pd.DataFrame({
+            'Sheet': sheet,
+            'Block': number,
+            'Index Name': df[columns['Index Name']].ffill() if 'Index Name' in columns else None,
+            'Country': df[columns['Country']],
+            'Index Score': pd.to_numeric(df[columns['Index Score']], errors='coerce'),
+        })
+        frames.append(block.dropna(subset=['Country', 'Index Score']))
+    if not frames:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+    return pd.concat(frames).sort_index(kind='stable').reset_index(drop=True)
+
+
+XLSX_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+XLSX_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+# A cell holding a shared string, e.g. <c r="B2" t="s"><v>4</v></c>
+SHARED_STRING_CELL = re.compile(rb'<(?:\w+:)?c\b[^>]*\bt="s"[^>]*>\s*<(?:\w+:)?v>(\d+)</')
+CELL_OVERLAP = 4096  # Longer than any one shared-string cell's XML
+
+
+def sheet_names(path):
+    """Return a workbook's sheet names without reading any sheet data."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        return [sheet.get('name') for sheet in workbook.iter(f'{XLSX_MAIN}sheet')]
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+        return pd.ExcelFile(path).sheet_names
+
+
+def sheet_fingerprints(path, chunk_size=1 << 20):
+    """Return {sheet name: content hash} for an .xlsx workbook without parsing any cells.
+
+    A sheet's hash covers its worksheet XML and the shared strings it uses, so editing or
+    adding one sheet leaves the other sheets' hashes alone. Worksheets and the shared
+    strings are read in chunks, so memory does not grow with the workbook. Returns None
+    for anything that is not an .xlsx workbook.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+            rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+            targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+
+            digests, used = {}, {}  # Shared string index -> sheets using it
+            for sheet in workbook.iter(f'{XLSX_MAIN}sheet'):
+                name = sheet.get('name')
+                target = targets[sheet.get(f'{XLSX_REL}id')]
+                digests[name] = digest = hashlib.sha256()
+                with zf.open(target.lstrip('/') if target.startswith('/') else f'xl/{target}') as f:
+                    # Cells are matched in a window that overlaps the next chunk, so a
+                    # cell split between two chunks is still seen (once)
+                    window = b''
+                    for chunk in iter(lambda: f.read(chunk_size), b''):
+                        digest.update(chunk)
+                        window += chunk
+                        cut = max(0, len(window) - CELL_OVERLAP)
+                        for match in SHARED_STRING_CELL.finditer(window):
+                            if match.start() < cut:
+                                used.setdefault(int(match.group(1)), set()).add(name)
+                        window = window[cut:]
+                    for match in SHARED_STRING_CELL.finditer(window):
+                        used.setdefault(int(match.group(1)), set()).add(name)
+
+            if used and 'xl/sharedStrings.xml' in zf.namelist():
+                with zf.open('xl/sharedStrings.xml') as f:
+                    index = 0
+                    for _, element in ET.iterparse(f):
+                        if element.tag != f'{XLSX_MAIN}si':
+                            continue
+                        text = ''.join(t.text or '' for t in element.iter(f'{XLSX_MAIN}t'))
+                        for name in used.pop(index, ()):
+                            digests[name].update(f"{index}\0{text}\0".encode('utf-8'))
+                        element.clear()
+                        index += 1
+            if used:
+                return None  # A cell points past the shared strings
+            return {name: digest.hexdigest() for name, digest in digests.items()}
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+        return None
+
+
+class SheetCache:
+    """Parsed sheets stored as columnar files, keyed by sheet name and content hash.
+
+    Entries are Feather files, so the cache needs pyarrow; without it sheets are always
+    parsed. The cache is kept under `max_bytes` by evicting the least recently used entries.
+    """
+
+    VERSION = 2
+
+    def __init__(self, directory, max_bytes=64 * 2**20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sheet, fingerprint):
+        return hashlib.sha256(f"v{self.VERSION}\0{sheet}\0{fingerprint}".encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        path = self.directory / f"{key}.feather"
+        try:
+            frame = pd.read_feather(path)
+        except (OSError, ValueError, pyarrow.ArrowException):
+            self.misses += 1
+            return None
+        os.utime(path)  # Mark as recently used
+        self.hits += 1
+        return frame
+
+    def store(self, key, frame):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{key}.feather"
+        tmp_path = path.with_suffix('.tmp')
+        frame.reset_index(drop=True).astype({'Index Name': 'object'}).to_feather(tmp_path)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in `max_bytes`."""
+        if not self.directory.is_dir():
+            return
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.directory) if entry.is_file())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+def workbook_fingerprints(path):
+    """Return {sheet name: content hash} for any workbook.
+
+    Sheets of workbooks other than .xlsx all get the hash of the whole file.
+    """
+    fingerprints = sheet_fingerprints(path)
+    if fingerprints is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprints = {sheet: digest.hexdigest() for sheet in pd.ExcelFile(path).sheet_names}
+    return fingerprints
+
+
+def pandas_header(row):
+    """Column names pandas would give a header row: 'Unnamed: i' for blanks, '.1', '.2', ... on repeats."""
+    header, seen = [], {}
+    for i, value in enumerate(row):
+        name = f'Unnamed: {i}' if value is None else str(value)
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        header.append(f'{name}.{count}' if count else name)
+    return header
+
+
+def to_score(value):
+    """Convert a cell to a score the way pd.to_numeric(errors='coerce') would, or None."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if score != score else score  # NaN
+
+
+class CountryStats:
+    """Online per-country count, sum and sum of squares of scores.
+
+    Countries are kept in the order they are first seen. Each sheet's scores are added in
+    reading order and sheets are then combined in order (`merge`), so every way of reading
+    the workbooks -- whole frames, streamed rows, worker processes -- gives the same sums.
+    """
+
+    def __init__(self):
+        self.stats = {}  # Country -> [count, sum, sum of squares]
+
+    def __len__(self):
+        return len(self.stats)
+
+    @property
+    def rankings(self):
+        return sum(entry[0] for entry in self.stats.values())
+
+    @classmethod
+    def from_frame(cls, rankings):
+        """Totals of one sheet's long rows, from a single grouped pass."""
+        # bincount adds each country's scores one by one in reading order, as add() does
+        # for streamed rows. np.mean sums pairwise once there are 8 or more values, so a
+        # country with that many scores can differ from a plain mean in the last bits.
+        codes, countries = pd.factorize(rankings['Country'])
+        scores = rankings['Index Score'].to_numpy(dtype=float)
+        counts = np.bincount(codes, minlength=len(countries))
+        sums = np.bincount(codes, weights=scores, minlength=len(countries))
+        squares = np.bincount(codes, weights=scores * scores, minlength=len(countries))
+        stats = cls()
+        stats.stats = {country: [int(n), float(total), float(square)]
+                       for country, n, total, square in zip(countries.tolist(), counts, sums, squares)}
+        return stats
+
+    def add(self, country, score):
+        entry = self.stats.get(country)
+        if entry is None:
+            self.stats[country] = [1, score, score * score]
+        else:
+            entry[0] += 1
+            entry[1] += score
+            entry[2] += score * score
+
+    def merge(self, other):
+        """Add the totals of another sheet (or set of sheets) to these."""
+        for country, (count, total, squares) in other.stats.items():
+            entry = self.stats.get(country)
+            if entry is None:
+                self.stats[country] = [count, total, squares]
+            else:
+                entry[0] += count
+                entry[1] += total
+                entry[2] += squares
+
+    def ranked(self):
+        counts, sums, squares = (np.array([entry[i] for entry in self.stats.values()], dtype=float)
+                                 for i in range(3))
+        return rank_countries(list(self.stats), counts, sums, squares)
+
+
+def stream_sheets(path, sheets=None):
+    """Yield (sheet, per-country totals) for every sheet of a workbook (or just `sheets`).
+
+    The workbook is opened read-only, once, and its rows are iterated lazily, so memory
+    stays constant however many rankings there are. Rows are read exactly as
+    sheet_blocks() reads them from a pandas frame.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            if sheets is not None and worksheet.title not in sheets:
+                continue
+            rows = worksheet.iter_rows(values_only=True)
+            header = pandas_header(next(rows, ()))
+            positions = {name: i for i, name in enumerate(header)}
+            blocks = [(positions[columns['Country']], positions[columns['Index Score']])
+                      for columns in team_blocks(header)]
+            sheet_stats = CountryStats()
+            for row in rows:
+                for country_at, score_at in blocks:
+                    country = row[country_at] if country_at < len(row) else None
+                    score = to_score(row[score_at]) if score_at < len(row) else None
+                    if country is not None and score is not None:
+                        sheet_stats.add(country, score)
+            yield worksheet.title, sheet_stats
+    finally:
+        workbook.close()
 
-# Get all sheets from the Excel file
-xl = pd.ExcelFile(excel_file)
-sheets = xl.sheet_names
-
-# Initialize a dictionary to store all country scores
-country_scores = {}
-
-# Process each sheet
-for sheet in sheets:
-    df = pd.read_excel(excel_file, sheet_name=sheet)
-    
-    # Extract country and index score columns
-    # Assuming the structure is similar to the CSV with 'Country' and 'Index Score' columns
-    for idx, row in df.iterrows():
-        if pd.notna(row['Country']) and pd.notna(row['Index Score']):
-            country = row['Country']
-            score = float(row['Index Score'])
-            
-            if country not in country_scores:
-                country_scores[country] = []
-            country_scores[country].append(score)
-
-# Calculate average scores and create final dataframe
-final_data = []
-for country, scores in country_scores.items():
-    avg_score = np.mean(scores)
-    final_data.append({
-        'Country': country,
-        'Average Index Score': round(avg_score, 3),
-        'Number of Rankings': len(scores)
+
+def expand_inputs(patterns):
+    """Expand workbook paths, directories and glob patterns into a list of workbooks."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.xlsx')))
+        else:
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        # Skip the lock files Excel leaves next to open workbooks
+        paths += [path for path in matches if not os.path.basename(path).startswith('~$') and path not in paths]
+    return paths
+
+
+def workbook_partials(path, sheets, stream=False, cache=None, keys=None):
+    """Parse some sheets of one workbook into per-sheet country totals (runs in a worker).
+
+    The workbook is read once for all of `sheets`. Parsed sheets are stored in the
+    `cache` under their `keys`.
+    """
+    if stream:
+        partials = dict(stream_sheets(path, sheets))
+        return [partials.get(sheet, CountryStats()) for sheet in sheets]
+    frames = pd.read_excel(path, sheet_name=list(sheets))
+    partials = []
+    for sheet, key in zip(sheets, keys or [None] * len(sheets)):
+        frame = sheet_blocks(frames[sheet], sheet)
+        if cache is not None and key is not None:
+            cache.store(key, frame)
+        partials.append(CountryStats.from_frame(frame))
+    return partials
+
+
+def parse_sheets(tasks, workers=1, cache=None, stream=False):
+    """Return the per-country totals of each (workbook, sheet, cache key) task, in order.
+
+    Sheets found in the `cache` are not parsed at all. The rest are parsed in a pool of
+    `workers` processes, each returning only per-country totals. A workbook's sheets are
+    read together in one task; they are only split across tasks when there are more
+    workers than workbooks to parse.
+    """
+    partials = {}
+    if cache is not None and not stream:
+        for i, (_, _, key) in enumerate(tasks):
+            frame = cache.load(key) if key is not None else None
+            if frame is not None:
+                partials[i] = CountryStats.from_frame(frame)
+
+    by_workbook = {}
+    for i in range(len(tasks)):
+        if i not in partials:
+            by_workbook.setdefault(tasks[i][0], []).append(i)
+    # Spare workers split a workbook's sheets between them, each part still read in one go
+    share = max(1, workers // max(1, len(by_workbook)))
+    chunks = [pending[part::share] for pending in by_workbook.values() for part in range(share)]
+    chunks = [chunk for chunk in chunks if chunk]
+
+    def arguments(chunk):
+        return (tasks[chunk[0]][0], [tasks[i][1] for i in chunk], stream, cache,
+                [tasks[i][2] for i in chunk])
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            futures = [pool.submit(workbook_partials, *arguments(chunk)) for chunk in chunks]
+            results = [future.result() for future in futures]
+    else:
+        results = [workbook_partials(*arguments(chunk)) for chunk in chunks]
+    for chunk, chunk_partials in zip(chunks, results):
+        partials.update(zip(chunk, chunk_partials))
+    if cache is not None:
+        cache.evict()
+    return [partials[i] for i in range(len(tasks))]
+
+
+def aggregate_workbooks(paths, workers=1, cache=None, stream=False):
+    """Combine the per-country totals of every sheet of every workbook.
+
+    Sheets are parsed in parallel (see parse_sheets) and their totals merged here in
+    workbook and sheet order.
+    """
+    tasks = []
+    for path in paths:
+        if cache is not None and not stream:
+            tasks += [(path, sheet, cache.key(sheet, fingerprint))
+                      for sheet, fingerprint in workbook_fingerprints(path).items()]
+        else:
+            # Nothing to look up, so no need to hash the sheets
+            tasks += [(path, sheet, None) for sheet in sheet_names(path)]
+
+    stats = CountryStats()
+    for partial in parse_sheets(tasks, workers, cache, stream):
+        stats.merge(partial)
+    return stats
+
+
+class RankingState:
+    """Per-country totals and the contribution of every sheet, persisted between runs.
+
+    Each contribution is one sheet of one workbook: its content hash and its per-country
+    totals. An update only parses sheets that are new or changed. Sheets added after all
+    the known ones are folded straight into the totals. A changed or removed sheet is
+    retracted by re-merging the stored contributions of the others rather than by
+    subtracting its sums, so the totals stay bit-identical to a full run.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.contributions = {}  # (workbook, sheet) -> {'fingerprint': ..., 'stats': CountryStats}
+        self.totals = CountryStats()
+
+    @staticmethod
+    def _dump_stats(stats):
+        return [[country] + entry for country, entry in stats.stats.items()]
+
+    @staticmethod
+    def _load_stats(rows):
+        stats = CountryStats()
+        stats.stats = {row[0]: list(row[1:]) for row in rows}
+        return stats
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.VERSION:
+            return False
+        self.contributions = {
+            (entry['workbook'], entry['sheet']): {'fingerprint': entry['fingerprint'],
+                                                  'stats': self._load_stats(entry['stats'])}
+            for entry in data['contributions']
+        }
+        self.totals = self._load_stats(data['totals'])
+        return True
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'version': self.VERSION,
+            'contributions': [{'workbook': workbook, 'sheet': sheet, 'fingerprint': entry['fingerprint'],
+                               'stats': self._dump_stats(entry['stats'])}
+                              for (workbook, sheet), entry in self.contributions.items()],
+            'totals': self._dump_stats(self.totals),
+        }
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def update(self, paths, workers=1, cache=None, stream=False):
+        """Bring the totals up to date with the sheets of `paths`.
+
+        Returns the countries whose totals changed, or None when the totals were rebuilt
+        from the stored contributions.
+        """
+        sheets = [((os.path.normpath(path), sheet), fingerprint)
+                  for path in paths for sheet, fingerprint in workbook_fingerprints(path).items()]
+        changed = [(key, fingerprint) for key, fingerprint in sheets
+                   if self.contributions.get(key, {}).get('fingerprint') != fingerprint]
+        tasks = [(workbook, sheet, cache.key(sheet, fingerprint) if cache is not None else None)
+                 for (workbook, sheet), fingerprint in changed]
+        parsed = dict(zip((key for key, _ in changed), parse_sheets(tasks, workers, cache, stream)))
+
+        known = list(self.contributions)
+        appended = [key for key, _ in sheets][:len(known)] == known and not any(key in self.contributions for key, _ in changed)
+        self.contributions = {
+            key: {'fingerprint': fingerprint, 'stats': parsed[key]} if key in parsed else self.contributions[key]
+            for key, fingerprint in sheets
+        }
+        if appended:
+            touched = set()
+            for key in parsed:
+                self.totals.merge(parsed[key])
+                touched.update(parsed[key].stats)
+            return touched
+
+        self.totals = CountryStats()
+        for entry in self.contributions.values():
+            self.totals.merge(entry['stats'])
+        return None
+
+
+class TopCountries:
+    """Heap of countries by rounded average score, for the live top N.
+
+    Updating a country pushes a new entry; its old entry is skipped when it surfaces.
+    Ties go to the country seen first, as in the CSV.
+    """
+
+    def __init__(self, stats):
+        self.refresh(stats)
+
+    def refresh(self, stats, countries=None):
+        """Re-score `countries` (or rebuild everything when None) from `stats`."""
+        if countries is None:
+            self.order = {country: i for i, country in enumerate(stats.stats)}
+            self.current = {}
+            self.heap = []
+            countries = stats.stats
+        for country in countries:
+            entry = stats.stats.get(country)
+            if entry is None:
+                self.current.pop(country, None)
+                continue
+            order = self.order.setdefault(country, len(self.order))
+            item = (-float(np.round(entry[1] / entry[0], 3)), order, country)
+            if self.current.get(country) != item:
+                self.current[country] = item
+                heapq.heappush(self.heap, item)
+        if len(self.heap) > 2 * len(self.current) + 16:
+            self.heap = list(self.current.values())
+            heapq.heapify(self.heap)
+
+    def top(self, n=10):
+        """Return the `n` best (country, average score) pairs."""
+        found = []
+        while self.heap and len(found) < n:
+            item = heapq.heappop(self.heap)
+            if self.current.get(item[2]) == item:
+                found.append(item)
+        for item in found:
+            heapq.heappush(self.heap, item)
+        return [(country, -score) for score, _, country in found]
+
+
+def state_file(output):
+    """Where the aggregate state for an output CSV is kept: next to it."""
+    return os.path.splitext(output)[0] + '_state.json'
+
+
+def write_rankings(final_df, output):
+    """Write the rankings CSV in one step, so a reader never sees a partial file."""
+    tmp_path = f"{output}.tmp"
+    final_df.to_csv(tmp_path, columns=CSV_COLUMNS, index=False)
+    os.replace(tmp_path, output)
+
+
+def print_top(top, n=10):
+    print(f"\nTop {n} Countries by Average Index Score:")
+    for rank, (country, score) in enumerate(top.top(n), start=1):
+        print(f"{rank:>4}  {country:<30} {score:>7.3f}")
+
+
+def watch_rankings(patterns, state, output, interval=1.0, **options):
+    """Re-rank whenever a workbook matching `patterns` is added, saved or removed.
+
+    Workbooks are polled every `interval` seconds; only new or changed sheets are parsed
+    and the CSV and state are rewritten. Runs until interrupted.
+    """
+    top = TopCountries(state.totals)
+    seen = None
+    print(f"Watching {', '.join(patterns)} every {interval}s; press Ctrl+C to stop")
+    while True:
+        paths = [path for path in expand_inputs(patterns) if os.path.isfile(path)]
+        snapshot = {path: (os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths}
+        if snapshot != seen:
+            started = time.perf_counter()
+            try:
+                touched = state.update(paths, **options)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                # Usually a workbook that is still being written; try again next time
+                print(f"Could not read the workbooks yet ({e})")
+            else:
+                seen = snapshot
+                if touched is None or touched:
+                    top.refresh(state.totals, touched)
+                    write_rankings(state.totals.ranked(), output)
+                    state.save()
+                    print(f"\n{time.strftime('%H:%M:%S')} updated {output} in "
+                          f"{time.perf_counter() - started:.2f}s ({state.totals.rankings} rankings)")
+                    print_top(top)
+        time.sleep(interval)
+
+
+def rank_countries(countries, counts, sums, squares):
+    """Rank countries by average score from their count, sum and sum of squares of scores.
+
+    Countries with the same rounded average keep the order they are given in, so the
+    ranking does not depend on the sort implementation.
+    """
+    means = sums / counts
+    # Sample variance from the sums; one ranking has no spread
+    variance = np.where(counts > 1, (squares - sums * means) / np.maximum(counts - 1, 1), np.nan)
+    final_df = pd.DataFrame({
+        'Country': countries,
+        'Average Index Score': np.round(means, 3),
+        'Number of Rankings': counts.astype(int),
+        'Score Std Dev': np.sqrt(np.clip(variance, 0, None)),
     })
+    final_df = final_df.sort_values('Average Index Score', ascending=False, kind='mergesort')
+    final_df['Rank'] = range(1, len(final_df) + 1)
 
-# Create DataFrame and sort by average score
-final_df = pd.DataFrame(final_data)
-final_df = final_df.sort_values('Average Index Score', ascending=False)
-final_df['Rank'] = range(1, len(final_df) + 1)
+    # Reorder columns
+    return final_df[CSV_COLUMNS + ['Score Std Dev']]
 
-# Reorder columns
-final_df = final_df[['Rank', 'Country', 'Average Index Score', 'Number of Rankings']]
 
-# Save to CSV
-output_file = 'data/average_rankings.csv'
-final_df.to_csv(output_file, index=False)
-print(f"\nResults saved to {output_file}")
-print("\nTop 10 Countries by Average Index Score:")
-print(final_df.head(10).to_string(index=False))
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Average the class's country rankings.")
+    parser.add_argument('inputs', nargs='*', metavar='WORKBOOK',
+                        help=f"Workbooks, directories of .xlsx files or glob patterns "
+                             f"(default: {excel_file}).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes that parse sheets in parallel (default: one per CPU).")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Parse every sheet instead of loading unchanged ones from the cache.")
+    parser.add_argument('--cache-dir', default=cache_dir,
+                        help=f"Where parsed sheets are cached (default: {cache_dir}).")
+    parser.add_argument('--cache-size-mb', type=float, default=64,
+                        help="Size bound of the sheet cache in MB (default: 64).")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read workbooks row by row into running per-country totals, in "
+                             "constant memory (the sheet cache is not used).")
+    parser.add_argument('--output', default=output_file,
+                        help=f"Where to write the rankings (default: {output_file}).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Update the per-country totals saved next to the output from new or "
+                             "changed sheets only, instead of starting from scratch.")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and update the rankings whenever a workbook is added or "
+                             "saved (implies --incremental).")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="With --watch, seconds between checks for changed workbooks (default: 1).")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    patterns = args.inputs or [excel_file]
+    paths = expand_inputs(patterns)
+    cache = None
+    if not (args.no_cache or args.stream):
+        if pyarrow is not None:
+            cache = SheetCache(args.cache_dir, int(args.cache_size_mb * 2**20))
+        else:
+            print("pyarrow is not installed, so every sheet is parsed (the sheet cache needs it)")
+    options = {'workers': args.workers, 'cache': cache, 'stream': args.stream}
+
+    if args.incremental or args.watch:
+        state = RankingState(state_file(args.output))
+        state.load()
+        if args.watch:
+            try:
+                watch_rankings(patterns, state, args.output, interval=args.interval, **options)
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
+        else:
+            touched = state.update(paths, **options)
+            write_rankings(state.totals.ranked(), args.output)
+            state.save()
+            print(f"\nResults saved to {args.output}")
+            changed = 'all' if touched is None else len(touched)
+            print(f"{state.totals.rankings} rankings of {len(state.totals)} countries, {changed} updated")
+            print_top(TopCountries(state.totals))
+    else:
+        stats = aggregate_workbooks(paths, **options)
+        final_df = stats.ranked()
+        if cache is not None:
+            print(f"Sheet cache: {cache.hits} sheets loaded, {cache.misses} parsed")
+
+        # Save to CSV
+        write_rankings(final_df, args.output)
+        print(f"\nResults saved to {args.output}")
+        print(f"{stats.rankings} rankings of {len(final_df)} countries from {len(paths)} workbooks")
+        print("\nTop 10 Countries by Average Index Score:")
+        print(final_df.head(10).round({'Score Std Dev': 3}).to_string(index=False))
@@ -0,0 +1,277 @@
+"""Benchmark `CanvasIntegrator.sync_materials()` against the fake Canvas server.
+
+For each course size (number of lectures, each with slides and notes) three syncs are run
+in a fresh working directory:
+
+    cold   first sync into an empty course
+    warm   immediate re-run with nothing changed
+    touch  re-run after editing one lecture's slides
+
+Each run reports wall time, requests by endpoint, bytes sent and received, and peak Python
+memory. Request counts are checked against budgets.json; the script exits non-zero if any
+run goes over its budget, so re-listing regressions show up as a failed run. A final check
+syncs into a module that already holds non-lecture items and a repeated lecture title, and
+fails the run unless the lecture items are laid out ahead of them. Another resumes a first
+sync killed after one upload and fails the run if the resumed sync uploads a duplicate:
+
+    python benchmarks/bench_sync.py                  # 10, 100 and 1000 lectures
+    python benchmarks/bench_sync.py --sizes 10 100 --latency 0.005
+    python benchmarks/bench_sync.py --write-budget   # record current counts as the budget
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent))
+
+from canvas_integration import CanvasIntegrator  # noqa: E402
+from fake_canvas import FakeCanvas  # noqa: E402
+
+SCENARIOS = ("cold", "warm", "touch")
+DEFAULT_BUDGET = HERE / "budgets.json"
+
+
+def make_course_tree(root: Path, lectures: int, file_size: int) -> None:
+    """Write a synthetic lecture_slides/lecture_notes/course_materials tree under `root`."""
+    for folder in ("lecture_slides", "lecture_notes", "course_materials"):
+        (root / folder).mkdir(parents=True, exist_ok=True)
+    padding = b"\0" * max(0, file_size - 32)
+    for num in range(1, lectures + 1):
+        (root / "lecture_slides" / f"Lecture{num}_updated.pdf").write_bytes(
+            b"%%PDF slides %d\n" % num + padding)
+        (root / "lecture_notes" / f"Lecture{num}notes_updated.pdf").write_bytes(
+            b"%%PDF notes %d\n" % num + padding)
+    (root / "course_materials" / "syllabus.pdf").write_bytes(b"%PDF syllabus\n" + padding)
+
+
+def run_sync(canvas: FakeCanvas, course_id: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run one sync and return its measurements."""
+    canvas.stats.reset()
+    integrator = CanvasIntegrator(
+        "benchmark-token",
+        course_id,
+        base_url=canvas.base_url,
+        public_site_base_url="https://example.edu/econ1",
+        max_workers=args.workers,
+        use_graphql=args.graphql,
+    )
+    output = io.StringIO()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            integrator.sync_materials()
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        integrator.http.close()
+    if args.verbose:
+        print(output.getvalue())
+    return {
+        'seconds': round(elapsed, 3),
+        'requests': canvas.stats.requests,
+        'by_endpoint': dict(sorted(canvas.stats.by_endpoint.items())),
+        'bytes_sent': canvas.stats.bytes_in,
+        'bytes_received': canvas.stats.bytes_out,
+        'peak_memory': peak,
+    }
+
+
+def bench_size(lectures: int, args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """Run every scenario for one course size."""
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work, FakeCanvas(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_bucket=args.rate_limit_bucket,
+        rate_limit_refill=args.rate_limit_refill,
+    ) as canvas:
+        canvas.add_course("1")
+        make_course_tree(Path(work), lectures, args.file_size)
+        os.chdir(work)
+        try:
+            results['cold'] = run_sync(canvas, "1", args)
+            results['warm'] = run_sync(canvas, "1", args)
+            Path("lecture_slides/Lecture1_updated.pdf").write_bytes(b"%PDF slides 1, revised\n")
+            results['touch'] = run_sync(canvas, "1", args)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def check_module_layout(args: argparse.Namespace) -> List[str]:
+    """Sync into a module that already holds a non-lecture item and a repeated lecture title.
+
+    Both must end up after the lecture items, which are laid out in lecture order. Returns
+    a description of each problem found.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work, FakeCanvas() as canvas:
+        course = canvas.add_course("1")
+        make_course_tree(Path(work), 3, args.file_size)
+        module = course.add_module("Lecture Materials", position=2)
+        course.add_item(module['id'], "Welcome page", item_type='ExternalUrl',
+                        external_url="https://example.edu/welcome")
+        for title in ("Lecture 2 - Slides", "Lecture 1 - Slides", "Lecture 2 - Slides"):
+            course.add_item(module['id'], title)
+        os.chdir(work)
+        try:
+            run_sync(canvas, "1", args)
+        except Exception as e:
+            return [f"module layout: sync failed with {e!r}"]
+        finally:
+            os.chdir(cwd)
+        titles = [item['title'] for item in course.items[module['id']]]
+
+    lectures = [f"Lecture {num} - {kind}" for num in (1, 2, 3) for kind in ("Slides", "Notes")]
+    expected = lectures + ["Welcome page", "Lecture 2 - Slides"]
+    if titles != expected:
+        return [f"module layout: got {titles}, expected {expected}"]
+    return []
+
+
+class Killed(BaseException):
+    """Stops a sync part way, like the job being killed (not an error the sync handles)."""
+
+
+def check_resume(args: argparse.Namespace) -> List[str]:
+    """Resume a first sync that was killed after one upload, into a course with a file already.
+
+    The killed run saves neither its manifest nor its hash index, only its journal, as
+    when a CI job times out. The resumed run must find the existing file rather than
+    upload it again. Returns a description of each problem found.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work, FakeCanvas() as canvas:
+        course = canvas.add_course("1")
+        make_course_tree(Path(work), 3, args.file_size)
+        os.chdir(work)
+        try:
+            course.add_file("lecture_slides", "Lecture1_updated.pdf",
+                            Path("lecture_slides/Lecture1_updated.pdf").read_bytes())
+            killed = CanvasIntegrator("benchmark-token", "1", base_url=canvas.base_url, max_workers=1)
+            killed.state.save = killed.hashes.save = killed.journal.clear = lambda: None
+            uploads = []
+
+            def apply_upload(op):
+                # Let the first upload through, then die as a killed job would
+                uploads.append(op)
+                if len(uploads) > 1:
+                    raise Killed()
+                return CanvasIntegrator.apply_upload(killed, op)
+
+            killed.apply_upload = apply_upload
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    killed.sync_materials()
+                except Killed:
+                    pass
+            killed.http.close()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_sync(canvas, "1", args)
+        except Exception as e:
+            return [f"resume: sync failed with {e!r}"]
+        finally:
+            os.chdir(cwd)
+        names = sorted(file['display_name'] for file in course.files.values())
+
+    expected = sorted([f"Lecture{num}_updated.pdf" for num in (1, 2, 3)]
+                      + [f"Lecture{num}notes_updated.pdf" for num in (1, 2, 3)] + ["syllabus.pdf"])
+    if names != expected:
+        return [f"resume: Canvas holds {names}, expected {expected}"]
+    return []
+
+
+def print_results(lectures: int, results: Dict[str, Dict[str, Any]],
+                  budget: Dict[str, int]) -> List[str]:
+    """Print one size's results and return the budget violations."""
+    violations = []
+    print(f"\n==== {lectures} LECTURES ====")
+    print(f"{'scenario':<8} {'seconds':>9} {'requests':>9} {'budget':>7} "
+          f"{'sent MB':>9} {'recv MB':>9} {'peak MB':>9}")
+    for scenario in SCENARIOS:
+        r = results[scenario]
+        limit = budget.get(scenario)
+        flag = ''
+        if limit is not None and r['requests'] > limit:
+            flag = '  OVER BUDGET'
+            violations.append(f"{lectures} lectures/{scenario}: {r['requests']} requests > {limit}")
+        print(f"{scenario:<8} {r['seconds']:>9.2f} {r['requests']:>9} {str(limit or '-'):>7} "
+              f"{r['bytes_sent'] / 1e6:>9.2f} {r['bytes_received'] / 1e6:>9.2f} "
+              f"{r['peak_memory'] / 1e6:>9.2f}{flag}")
+    for scenario in SCENARIOS:
+        print(f"  {scenario}:")
+        for endpoint, n in results[scenario]['by_endpoint'].items():
+            print(f"    {n:>6}  {endpoint}")
+    return violations
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the Canvas sync against a fake Canvas server.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help="Course sizes to run, in lectures (default: 10 100 1000).")
+    parser.add_argument('--budget', type=Path, default=DEFAULT_BUDGET,
+                        help="JSON file of request budgets per size and scenario.")
+    parser.add_argument('--write-budget', action='store_true',
+                        help="Record this run's request counts as the budget instead of checking them.")
+    parser.add_argument('--json', type=Path, help="Also write the full results to this file.")
+    parser.add_argument('--workers', type=int, default=4, help="Upload workers (default: 4).")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds of latency the fake server adds to every request.")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of API requests that fail with a 503.")
+    parser.add_argument('--rate-limit-bucket', type=float, default=700.0)
+    parser.add_argument('--rate-limit-refill', type=float, default=10000.0,
+                        help="Rate-limit refill per second; lower it to exercise throttling.")
+    parser.add_argument('--graphql', action='store_true',
+                        help="Load modules through the fake GraphQL endpoint.")
+    parser.add_argument('--file-size', type=int, default=4096, help="Bytes per synthetic PDF.")
+    parser.add_argument('--verbose', action='store_true', help="Show the sync's own output.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    budgets = json.loads(args.budget.read_text()) if args.budget.exists() else {}
+
+    all_results, violations = {}, []
+    for lectures in args.sizes:
+        results = bench_size(lectures, args)
+        all_results[str(lectures)] = results
+        violations += print_results(lectures, results, budgets.get(str(lectures), {}))
+    violations += check_module_layout(args)
+    violations += check_resume(args)
+
+    if args.json:
+        args.json.write_text(json.dumps(all_results, indent=2) + "\n")
+
+    if args.write_budget:
+        for lectures, results in all_results.items():
+            budgets[lectures] = {scenario: results[scenario]['requests'] for scenario in SCENARIOS}
+        args.budget.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+        print(f"\nWrote request budgets to {args.budget}")
+        return 0
+
+    if violations:
+        print("\n==== BENCHMARK CHECKS FAILED ====")
+        for violation in violations:
+            print(violation)
+        return 1
+    print("\nAll runs within request budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
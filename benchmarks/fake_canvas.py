@@ -0,0 +1,617 @@
+"""In-process stand-in for the parts of the Canvas REST API that canvas_integration.py uses.
+
+The server runs on a background thread and speaks real HTTP, so the integrator is exercised
+end to end (sessions, pagination, uploads, retries) without touching a real course:
+
+    with FakeCanvas() as canvas:
+        canvas.add_course("1234")
+        integrator = CanvasIntegrator("token", "1234", base_url=canvas.base_url)
+        integrator.sync_materials()
+        print(canvas.stats.by_endpoint)
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+def _stamp(seconds: float) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+class FakeCanvasStats:
+    """Request counters collected by the fake server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.by_endpoint: Counter = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, endpoint: str, bytes_in: int, bytes_out: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.by_endpoint[endpoint] += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+
+class FakeCourse:
+    """Files, folders, modules and module items of one fake course."""
+
+    def __init__(self, canvas: 'FakeCanvas', course_id: str):
+        self.canvas = canvas
+        self.id = str(course_id)
+        self.folders: Dict[int, Dict[str, Any]] = {}
+        self.files: Dict[int, Dict[str, Any]] = {}
+        self.modules: Dict[int, Dict[str, Any]] = {}
+        self.items: Dict[int, List[Dict[str, Any]]] = {}
+        self.root = self._new_folder("course files", None)
+
+    def _new_folder(self, full_name: str, parent_id: Optional[int]) -> Dict[str, Any]:
+        folder = {
+            'id': self.canvas.next_id(),
+            'name': full_name.rsplit('/', 1)[-1],
+            'full_name': full_name,
+            'parent_folder_id': parent_id,
+            'updated_at': self.canvas.now(),
+        }
+        self.folders[folder['id']] = folder
+        return folder
+
+    def folder_by_path(self, path: str, create: bool = False) -> Optional[Dict[str, Any]]:
+        folder = self.root
+        for part in [p for p in (path or '').strip('/').split('/') if p]:
+            full_name = f"{folder['full_name']}/{part}"
+            child = next((f for f in self.folders.values() if f['full_name'] == full_name), None)
+            if child is None:
+                if not create:
+                    return None
+                child = self._new_folder(full_name, folder['id'])
+            folder = child
+        return folder
+
+    def add_file(self, folder_path: str, filename: str, content: bytes = b'%PDF-1.4\n',
+                 overwrite: bool = False) -> Dict[str, Any]:
+        folder = self.folder_by_path(folder_path, create=True)
+        existing = next((f for f in self.files.values()
+                         if f['folder_id'] == folder['id'] and f['display_name'] == filename), None)
+        if existing is not None and overwrite:
+            del self.files[existing['id']]
+        elif existing is not None:
+            stem, dot, ext = filename.rpartition('.')
+            filename = f"{stem}-{existing['id']}.{ext}" if dot else f"{filename}-{existing['id']}"
+        file = {
+            'id': self.canvas.next_id(),
+            'filename': filename,
+            'display_name': filename,
+            'folder_id': folder['id'],
+            'size': len(content),
+            'content-type': 'application/pdf',
+            'updated_at': self.canvas.now(),
+        }
+        self.files[file['id']] = file
+        self.canvas.blobs[file['id']] = content
+        if existing is not None and overwrite:
+            # Canvas repoints module items at the replacement file
+            for items in self.items.values():
+                for item in items:
+                    if item.get('content_id') == existing['id']:
+                        item['content_id'] = file['id']
+        return file
+
+    def add_module(self, name: str, position: Optional[int] = None) -> Dict[str, Any]:
+        module = {
+            'id': self.canvas.next_id(),
+            'name': name,
+            'position': position or len(self.modules) + 1,
+        }
+        self.modules[module['id']] = module
+        self.items[module['id']] = []
+        return module
+
+    def module_json(self, module: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(module, items_count=len(self.items[module['id']]))
+
+    def add_item(self, module_id: int, title: str, item_type: str = 'File',
+                 content_id: Optional[int] = None, external_url: Optional[str] = None,
+                 position: Optional[int] = None) -> Dict[str, Any]:
+        items = self.items[module_id]
+        item = {
+            'id': self.canvas.next_id(),
+            'module_id': module_id,
+            'title': title,
+            'type': item_type,
+        }
+        if content_id is not None:
+            item['content_id'] = int(content_id)
+        if external_url:
+            item['external_url'] = external_url
+        index = len(items) if position is None else max(0, min(int(position) - 1, len(items)))
+        items.insert(index, item)
+        self._renumber(module_id)
+        return item
+
+    def move_item(self, module_id: int, item: Dict[str, Any], position: int) -> None:
+        items = self.items[module_id]
+        items.remove(item)
+        items.insert(max(0, min(int(position) - 1, len(items))), item)
+        self._renumber(module_id)
+
+    def _renumber(self, module_id: int) -> None:
+        for position, item in enumerate(self.items[module_id], start=1):
+            item['position'] = position
+
+    def find_item(self, item_id: int):
+        for module_id, items in self.items.items():
+            for item in items:
+                if item['id'] == item_id:
+                    return module_id, item
+        return None, None
+
+
+class FakeCanvas:
+    """Threaded fake Canvas server with pagination, rate-limit headers and fault injection.
+
+    `latency` adds a fixed delay to every request. `graphql=False` makes `/api/graphql`
+    return 404, as on instances without GraphQL. `error_rate` makes that fraction of API
+    requests fail with `error_status` (503 by default); `upload_error_rate` does the same
+    for byte transfers to upload URLs. `rate_limit_bucket` emulates
+    Canvas's leaky bucket: every request costs `request_cost` units, the bucket refills at
+    `rate_limit_refill` units per second and requests beyond it get a 403 throttle response.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 rate_limit_bucket: float = 700.0, request_cost: float = 1.0,
+                 rate_limit_refill: float = 10.0, page_limit: int = 100, seed: int = 0,
+                 upload_error_rate: float = 0.0, graphql: bool = True):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.upload_error_rate = upload_error_rate
+        self.graphql = graphql
+        self.error_status = error_status
+        self.rate_limit_bucket = rate_limit_bucket
+        self.request_cost = request_cost
+        self.rate_limit_refill = rate_limit_refill
+        self.page_limit = page_limit
+        self.random = random.Random(seed)
+        self.stats = FakeCanvasStats()
+        self.courses: Dict[str, FakeCourse] = {}
+        self.blobs: Dict[int, bytes] = {}
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.RLock()
+        self._ids = count(1000)
+        self._clock = time.time()
+        self._bucket = rate_limit_bucket
+        self._bucket_at = time.monotonic()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # -- lifecycle ---------------------------------------------------------------------
+
+    def start(self) -> 'FakeCanvas':
+        handler = type('FakeCanvasHandler', (_FakeCanvasHandler,), {'canvas': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'FakeCanvas':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # -- helpers -----------------------------------------------------------------------
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def now(self) -> str:
+        # Strictly increasing timestamps keep `updated_at` ordering deterministic
+        with self.lock:
+            self._clock += 1
+            return _stamp(self._clock)
+
+    def add_course(self, course_id: str) -> FakeCourse:
+        course = FakeCourse(self, course_id)
+        self.courses[str(course_id)] = course
+        return course
+
+    def _take_from_bucket(self) -> Optional[float]:
+        """Charge one request against the rate-limit bucket. Returns None when throttled."""
+        with self.lock:
+            now = time.monotonic()
+            self._bucket = min(self.rate_limit_bucket,
+                               self._bucket + (now - self._bucket_at) * self.rate_limit_refill)
+            self._bucket_at = now
+            if self._bucket < self.request_cost:
+                return None
+            self._bucket -= self.request_cost
+            return self._bucket
+
+
+_ROUTE_PARAM = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+
+class _Reply(Exception):
+    def __init__(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class _FakeCanvasHandler(BaseHTTPRequestHandler):
+    canvas: FakeCanvas
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+    ROUTES = [
+        ('GET', r'/api/v1/courses/(?P<course>[^/]+)/files', 'list_course_files'),
+        ('POST', r'/api/v1/courses/(?P<course>[^/]+)/files', 'start_upload'),
+        ('GET', r'/api/v1/courses/(?P<course>[^/]+)/folders', 'list_folders'),
+        ('POST', r'/api/v1/courses/(?P<course>[^/]+)/folders', 'create_folder'),
+        ('GET', r'/api/v1/courses/(?P<course>[^/]+)/folders/by_path(?P<path>.*)', 'resolve_path'),
+        ('GET', r'/api/v1/folders/(?P<folder>\d+)/files', 'list_folder_files'),
+        ('POST', r'/api/v1/folders/(?P<folder>\d+)/copy_file', 'copy_file'),
+        ('GET', r'/api/v1/courses/(?P<course>[^/]+)/modules', 'list_modules'),
+        ('POST', r'/api/v1/courses/(?P<course>[^/]+)/modules', 'create_module'),
+        ('DELETE', r'/api/v1/courses/(?P<course>[^/]+)/modules/(?P<module>\d+)', 'delete_module'),
+        ('GET', r'/api/v1/courses/(?P<course>[^/]+)/modules/(?P<module>\d+)/items', 'list_items'),
+        ('POST', r'/api/v1/courses/(?P<course>[^/]+)/modules/(?P<module>\d+)/items', 'create_item'),
+        ('PUT', r'/api/v1/courses/(?P<course>[^/]+)/modules/(?P<module>\d+)/items/(?P<item>\d+)', 'update_item'),
+        ('DELETE', r'/api/v1/courses/(?P<course>[^/]+)/modules/(?P<module>\d+)/items/(?P<item>\d+)', 'delete_item'),
+        ('GET', r'/api/v1/files/(?P<file>\d+)', 'get_file'),
+        ('PUT', r'/api/v1/files/(?P<file>\d+)', 'update_file'),
+        ('DELETE', r'/api/v1/files/(?P<file>\d+)', 'delete_file'),
+        ('POST', r'/api/graphql', 'graphql'),
+        ('POST', r'/upload/(?P<token>[^/]+)', 'finish_upload'),
+        ('GET', r'/files/(?P<file>\d+)/download', 'download_file'),
+    ]
+
+    def log_message(self, format, *args):  # noqa: A002 - silence the default stderr logging
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    # -- plumbing ----------------------------------------------------------------------
+
+    def _dispatch(self, method: str) -> None:
+        canvas = self.canvas
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.raw_body = self.rfile.read(length) if length else b''
+        self.query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        self.query_lists = parse_qs(parsed.query)
+
+        endpoint, handler, match = f"{method} (unknown)", None, None
+        for route_method, pattern, name in self.ROUTES:
+            m = re.fullmatch(pattern, parsed.path)
+            if m and route_method == method:
+                handler, match = getattr(self, name), m
+                endpoint = f"{method} " + _ROUTE_PARAM.sub(r':\1', pattern)
+                break
+
+        if canvas.latency:
+            time.sleep(canvas.latency)
+
+        headers: Dict[str, str] = {}
+        try:
+            if handler is None:
+                raise _Reply(404, {'errors': [{'message': 'not found'}]})
+            if parsed.path.startswith('/api/'):
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    raise _Reply(401, {'errors': [{'message': 'unauthorized'}]})
+                remaining = canvas._take_from_bucket()
+                if remaining is None:
+                    raise _Reply(403, '403 Forbidden (Rate Limit Exceeded)',
+                                 {'X-Rate-Limit-Remaining': '0.0',
+                                  'X-Request-Cost': str(canvas.request_cost)})
+                headers['X-Rate-Limit-Remaining'] = f"{remaining:.1f}"
+                headers['X-Request-Cost'] = f"{canvas.request_cost:.1f}"
+                with canvas.lock:
+                    failed = canvas.error_rate and canvas.random.random() < canvas.error_rate
+                if failed:
+                    raise _Reply(canvas.error_status, {'errors': [{'message': 'injected'}]},
+                                 {'Retry-After': '0'})
+            elif canvas.upload_error_rate:
+                with canvas.lock:
+                    failed = canvas.random.random() < canvas.upload_error_rate
+                if failed:
+                    raise _Reply(canvas.error_status, {'errors': [{'message': 'injected'}]})
+            with canvas.lock:
+                status, body, extra = handler(**match.groupdict())
+            headers.update(extra)
+        except _Reply as reply:
+            status, body = reply.status, reply.body
+            headers.update(reply.headers)
+
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        canvas.stats.record(endpoint, len(self.raw_body), len(payload))
+
+    def form(self) -> Dict[str, str]:
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(self.raw_body or b'{}')
+        return {k: v[-1] for k, v in parse_qs(self.raw_body.decode()).items()}
+
+    def course(self, course: str) -> FakeCourse:
+        if course not in self.canvas.courses:
+            raise _Reply(404, {'errors': [{'message': 'course not found'}]})
+        return self.canvas.courses[course]
+
+    def paginate(self, records: List[Any]):
+        per_page = min(int(self.query.get('per_page', 10)), self.canvas.page_limit)
+        page = int(self.query.get('page', 1))
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(records):
+            query = dict(self.query, page=page + 1, per_page=per_page)
+            next_url = f"{self.canvas.base_url}{urlparse(self.path).path}?{urlencode(query)}"
+            headers['Link'] = f'<{next_url}>; rel="next"'
+        return 200, records[start:start + per_page], headers
+
+    def file_json(self, course: FakeCourse, file: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(file, url=f"{self.canvas.base_url}/files/{file['id']}/download")
+
+    # -- endpoints ---------------------------------------------------------------------
+
+    def list_course_files(self, course):
+        c = self.course(course)
+        files = list(c.files.values())
+        term = self.query.get('search_term')
+        if term:
+            files = [f for f in files if term.lower() in f['display_name'].lower()]
+        sort = self.query.get('sort', 'name')
+        key = {'updated_at': 'updated_at', 'size': 'size'}.get(sort, 'display_name')
+        files.sort(key=lambda f: (f[key], f['id']), reverse=self.query.get('order') == 'desc')
+        return self.paginate([self.file_json(c, f) for f in files])
+
+    def start_upload(self, course):
+        c = self.course(course)
+        form = self.form()
+        token = f"u{self.canvas.next_id()}"
+        folder = form.get('parent_folder_path') or ''
+        if form.get('parent_folder_id'):
+            parent = c.folders.get(int(form['parent_folder_id']))
+            if parent is None:
+                raise _Reply(404, {'errors': [{'message': 'folder not found'}]})
+            folder = parent['full_name'].partition('/')[2]
+        self.canvas.uploads[token] = {
+            'course': c.id,
+            'name': form['name'],
+            'folder': folder,
+            'overwrite': form.get('on_duplicate') == 'overwrite',
+        }
+        return 200, {
+            'upload_url': f"{self.canvas.base_url}/upload/{token}",
+            'upload_params': {'filename': form['name'], 'token': token},
+        }, {}
+
+    def finish_upload(self, token):
+        upload = self.canvas.uploads.get(token)
+        if upload is None:
+            raise _Reply(404, {'errors': [{'message': 'unknown upload'}]})
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + self.raw_body)
+        content = b''
+        for part in message.iter_parts():
+            if part.get_param('name', header='content-disposition') == 'file':
+                content = part.get_payload(decode=True)
+        c = self.canvas.courses[upload['course']]
+        file = c.add_file(upload['folder'], upload['name'], content, overwrite=upload['overwrite'])
+        del self.canvas.uploads[token]
+        return 201, self.file_json(c, file), {}
+
+    def list_folders(self, course):
+        c = self.course(course)
+        return self.paginate(sorted(c.folders.values(), key=lambda f: f['id']))
+
+    def create_folder(self, course):
+        c = self.course(course)
+        form = self.form()
+        parent = form.get('parent_folder_path') or ''
+        folder = c.folder_by_path(f"{parent.strip('/')}/{form['name']}", create=True)
+        return 200, folder, {}
+
+    def resolve_path(self, course, path=None):
+        c = self.course(course)
+        chain = [c.root]
+        for part in [p for p in (path or '').split('/') if p]:
+            full_name = f"{chain[-1]['full_name']}/{part}"
+            child = next((f for f in c.folders.values() if f['full_name'] == full_name), None)
+            if child is None:
+                raise _Reply(404, {'errors': [{'message': 'folder not found'}]})
+            chain.append(child)
+        return 200, chain, {}
+
+    def list_folder_files(self, folder):
+        for c in self.canvas.courses.values():
+            if int(folder) in c.folders:
+                break
+        else:
+            raise _Reply(404, {'errors': [{'message': 'folder not found'}]})
+        files = sorted((f for f in c.files.values() if f['folder_id'] == int(folder)),
+                       key=lambda f: (f['display_name'], f['id']))
+        return self.paginate([self.file_json(c, f) for f in files])
+
+    def copy_file(self, folder):
+        form = self.form()
+        courses = self.canvas.courses.values()
+        dest = next((c for c in courses if int(folder) in c.folders), None)
+        source_id = int(form.get('source_file_id', 0))
+        source = next((c.files[source_id] for c in courses if source_id in c.files), None)
+        if dest is None or source is None:
+            raise _Reply(404, {'errors': [{'message': 'not found'}]})
+        path = dest.folders[int(folder)]['full_name'].partition('/')[2]
+        file = dest.add_file(path, source['display_name'], self.canvas.blobs[source_id],
+                             overwrite=form.get('on_duplicate') == 'overwrite')
+        return 200, self.file_json(dest, file), {}
+
+    def list_modules(self, course):
+        c = self.course(course)
+        modules = sorted(c.modules.values(), key=lambda m: (m['position'], m['id']))
+        return self.paginate([c.module_json(m) for m in modules])
+
+    def create_module(self, course):
+        c = self.course(course)
+        form = self.form()
+        position = form.get('module[position]')
+        module = c.add_module(form['module[name]'], int(position) if position else None)
+        return 200, c.module_json(module), {}
+
+    def delete_module(self, course, module):
+        c = self.course(course)
+        removed = c.modules.pop(int(module), None)
+        c.items.pop(int(module), None)
+        if removed is None:
+            raise _Reply(404, {'errors': [{'message': 'module not found'}]})
+        return 200, removed, {}
+
+    def list_items(self, course, module):
+        c = self.course(course)
+        if int(module) not in c.items:
+            raise _Reply(404, {'errors': [{'message': 'module not found'}]})
+        return self.paginate(list(c.items[int(module)]))
+
+    def create_item(self, course, module):
+        c = self.course(course)
+        if int(module) not in c.items:
+            raise _Reply(404, {'errors': [{'message': 'module not found'}]})
+        form = self.form()
+        item = c.add_item(
+            int(module),
+            form['module_item[title]'],
+            form.get('module_item[type]', 'File'),
+            form.get('module_item[content_id]'),
+            form.get('module_item[external_url]'),
+            form.get('module_item[position]'),
+        )
+        return 200, item, {}
+
+    def update_item(self, course, module, item):
+        c = self.course(course)
+        module_id, found = c.find_item(int(item))
+        if found is None or module_id != int(module):
+            raise _Reply(404, {'errors': [{'message': 'item not found'}]})
+        form = self.form()
+        if 'module_item[title]' in form:
+            found['title'] = form['module_item[title]']
+        if 'module_item[position]' in form:
+            c.move_item(module_id, found, int(form['module_item[position]']))
+        return 200, found, {}
+
+    def get_file(self, file):
+        for c in self.canvas.courses.values():
+            if int(file) in c.files:
+                return 200, self.file_json(c, c.files[int(file)]), {}
+        raise _Reply(404, {'errors': [{'message': 'file not found'}]})
+
+    def download_file(self, file):
+        """Serve a file's bytes, like the pre-signed URL in a Canvas file's `url`."""
+        for c in self.canvas.courses.values():
+            if int(file) in c.files:
+                return 200, self.canvas.blobs[int(file)], {}
+        raise _Reply(404, {'errors': [{'message': 'file not found'}]})
+
+    def update_file(self, file):
+        for c in self.canvas.courses.values():
+            found = c.files.get(int(file))
+            if found is not None:
+                break
+        else:
+            raise _Reply(404, {'errors': [{'message': 'file not found'}]})
+        form = self.form()
+        if 'name' in form:
+            found['filename'] = found['display_name'] = form['name']
+            found['updated_at'] = self.canvas.now()
+        return 200, found, {}
+
+    def delete_file(self, file):
+        for c in self.canvas.courses.values():
+            found = c.files.pop(int(file), None)
+            if found is not None:
+                return 200, found, {}
+        raise _Reply(404, {'errors': [{'message': 'file not found'}]})
+
+    def graphql(self):
+        """Answer the module query the integrator sends; any other query is an error."""
+        if not self.canvas.graphql:
+            raise _Reply(404, {'errors': [{'message': 'not found'}]})
+        request = self.form()
+        variables = request.get('variables') or {}
+        if 'modulesConnection' not in request.get('query', ''):
+            return 200, {'errors': [{'message': 'unsupported query'}]}, {}
+        c = self.course(str(variables.get('courseId')))
+        modules = sorted(c.modules.values(), key=lambda m: (m['position'], m['id']))
+        start = int(variables.get('cursor') or 0)
+        page = modules[start:start + 50]
+        nodes = []
+        for module in page:
+            items = []
+            for item in c.items[module['id']]:
+                # Like Canvas, a file's content title is its display name, not the item title
+                file = c.files.get(item.get('content_id'))
+                title = file['display_name'] if file is not None else item['title']
+                content = {'__typename': item['type'], 'title': title}
+                if 'content_id' in item:
+                    content['_id'] = str(item['content_id'])
+                if 'external_url' in item:
+                    content['url'] = item['external_url']
+                items.append({'_id': str(item['id']), 'title': item['title'], 'content': content})
+            nodes.append({'_id': str(module['id']), 'name': module['name'],
+                          'position': module['position'], 'moduleItems': items})
+        more = start + 50 < len(modules)
+        connection = {'pageInfo': {'hasNextPage': more, 'endCursor': str(start + 50) if more else None},
+                      'nodes': nodes}
+        return 200, {'data': {'course': {'modulesConnection': connection}}}, {}
+
+    def delete_item(self, course, module, item):
+        c = self.course(course)
+        module_id, found = c.find_item(int(item))
+        if found is None or module_id != int(module):
+            raise _Reply(404, {'errors': [{'message': 'item not found'}]})
+        c.items[module_id].remove(found)
+        c._renumber(module_id)
+        return 200, found, {}
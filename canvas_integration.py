@@ -1,7 +1,28 @@
+import argparse
+import bisect
+import ctypes
+import ctypes.util
+import email.utils
+import hashlib
+import importlib
+import json
 import os
+import random
+import re
 import requests
+import select
+import shutil
+import struct
+import subprocess
+import threading
 import time
-from typing import Optional, Dict, List, Any
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from typing import Optional, Dict, List, Any, Tuple, Callable, Iterator
 from pathlib import Path
 
 try:
@@ -11,6 +32,1420 @@ except Exception:  # pragma: no cover
     load_dotenv = None
 
 
+# Canvas folders whose contents this script owns.
+MANAGED_FOLDERS = ("lecture_slides", "lecture_notes", "course_materials")
+
+
+class CanvasStateManifest:
+    """Local record of the Canvas files, folders, modules and module items for one course.
+
+    The manifest lets a sync reconcile only what changed since the previous run instead of
+    re-listing the whole course. It is a plain JSON file keyed by course ID.
+    """
+
+    VERSION = 1
+
+    FILE_KEYS = ('id', 'filename', 'display_name', 'folder_id', 'folder_path', 'size', 'updated_at')
+    FOLDER_KEYS = ('id', 'full_name', 'updated_at')
+    MODULE_KEYS = ('id', 'name', 'position', 'items_count')
+    ITEM_KEYS = ('id', 'title', 'type', 'content_id', 'external_url', 'position')
+
+    def __init__(self, state_dir: str, course_id: str):
+        self.course_id = str(course_id)
+        self.path = Path(state_dir) / f"state_{self.course_id}.json"
+        self.synced_commit: Optional[str] = None  # Git commit of the last successful sync
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything, e.g. before a full refresh."""
+        self.files_watermark: Optional[str] = None  # Newest file `updated_at` seen
+        self.folders: Dict[str, Dict] = {}
+        self.files: Dict[str, Dict] = {}
+        self.modules: Dict[str, Dict] = {}
+        self.module_items: Dict[str, List[Dict]] = {}
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.files and not self.modules
+
+    def load(self) -> bool:
+        """Load the manifest from disk. Returns False if there is nothing usable."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get('version') != self.VERSION or str(data.get('course_id')) != self.course_id:
+            return False
+
+        self.files_watermark = data.get('files_watermark')
+        self.synced_commit = data.get('synced_commit')
+        self.folders = data.get('folders', {})
+        self.files = data.get('files', {})
+        self.modules = data.get('modules', {})
+        self.module_items = data.get('module_items', {})
+        return True
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'version': self.VERSION,
+            'course_id': self.course_id,
+            'files_watermark': self.files_watermark,
+            'synced_commit': self.synced_commit,
+            'folders': self.folders,
+            'files': self.files,
+            'modules': self.modules,
+            'module_items': self.module_items,
+        }
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _trim(record: Dict, keys) -> Dict:
+        return {key: record[key] for key in keys if key in record}
+
+    def record_folder(self, folder: Dict) -> None:
+        self.folders[str(folder['id'])] = self._trim(folder, self.FOLDER_KEYS)
+
+    def folder_path(self, folder_id: Any) -> Optional[str]:
+        folder = self.folders.get(str(folder_id))
+        return folder.get('full_name') if folder else None
+
+    def folder_by_path(self, path: str) -> Optional[Dict]:
+        """Find a folder by its path below the course files root, e.g. "lecture_slides"."""
+        for folder in self.folders.values():
+            if folder.get('full_name', '').partition('/')[2] == path:
+                return folder
+        return None
+
+    def record_file(self, file: Dict) -> Dict:
+        self.files[str(file['id'])] = self._trim(file, self.FILE_KEYS)
+        return self.files[str(file['id'])]
+
+    def forget_file(self, file_id: Any) -> None:
+        self.files.pop(str(file_id), None)
+
+    def record_module(self, module: Dict) -> None:
+        self.modules[str(module['id'])] = self._trim(module, self.MODULE_KEYS)
+
+    def forget_module(self, module_id: Any) -> None:
+        self.modules.pop(str(module_id), None)
+        self.module_items.pop(str(module_id), None)
+
+    # Module items are kept in position order and renumbered the way Canvas does on every
+    # insert, move and delete, so the manifest stays accurate without re-listing.
+
+    def _renumber(self, module_id: Any) -> None:
+        items = self.module_items[str(module_id)]
+        for position, item in enumerate(items, start=1):
+            item['position'] = position
+        module = self.modules.get(str(module_id))
+        if module is not None:
+            module['items_count'] = len(items)
+
+    def set_module_items(self, module_id: Any, items: List[Dict]) -> List[Dict]:
+        items = sorted(items, key=lambda item: item.get('position') or 0)
+        self.module_items[str(module_id)] = [self._trim(item, self.ITEM_KEYS) for item in items]
+        self._renumber(module_id)
+        return self.module_items[str(module_id)]
+
+    def record_module_item(self, module_id: Any, item: Dict) -> None:
+        items = self.module_items.setdefault(str(module_id), [])
+        position = item.get('position') or len(items) + 1
+        items.insert(max(0, min(position - 1, len(items))), self._trim(item, self.ITEM_KEYS))
+        self._renumber(module_id)
+
+    def move_module_item(self, module_id: Any, item_id: Any, position: int) -> None:
+        items = self.module_items.get(str(module_id))
+        item = next((i for i in items or [] if str(i['id']) == str(item_id)), None)
+        if item is None:
+            return
+        items.remove(item)
+        items.insert(max(0, min(position - 1, len(items))), item)
+        self._renumber(module_id)
+
+    def forget_module_item(self, module_id: Any, item_id: Any) -> None:
+        items = self.module_items.get(str(module_id))
+        if items is None:
+            return
+        items[:] = [item for item in items if str(item['id']) != str(item_id)]
+        self._renumber(module_id)
+
+
+class SyncJournal:
+    """Append-only log of the Canvas changes made by a sync that is still running.
+
+    The state manifest and hash index are only written when a sync finishes, so a job that
+    is killed part way would otherwise forget everything it uploaded. Each completed
+    operation is appended as a JSON line and fsync'd before the sync moves on. The journal
+    is replayed into the manifest at startup and deleted once the manifest is saved.
+    """
+
+    def __init__(self, state_dir: str, course_id: str):
+        self.path = Path(state_dir) / f"journal_{course_id}.jsonl"
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, op: str, **fields) -> None:
+        line = json.dumps(dict(fields, op=op)) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Read back the journal. A line torn by a crash mid-write is ignored."""
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return entries
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path.unlink(missing_ok=True)
+
+
+# Lecture material kind of each managed folder, matching the module item titles
+MATERIAL_KINDS = {"lecture_slides": "Slides", "lecture_notes": "Notes"}
+
+# "Lecture3_updated.pdf", "Lecture1notes_updated.pdf", "Econ 2 Lecture 6 S25.pdf"
+LECTURE_FILENAME = re.compile(r'lecture[\s_]*(\d+)', re.IGNORECASE)
+
+
+def parse_lecture_number(filename: str) -> Optional[int]:
+    """Return the lecture number in a lecture material filename, if there is one."""
+    match = LECTURE_FILENAME.search(filename)
+    return int(match.group(1)) if match else None
+
+
+def managed_folder(folder_path: Optional[str]) -> Optional[str]:
+    """Map a Canvas folder path such as 'course files/lecture_slides' to its managed folder."""
+    name = (folder_path or '').rstrip('/').rsplit('/', 1)[-1]
+    return name if name in MANAGED_FOLDERS else None
+
+
+class FileIndex:
+    """Known Canvas files, indexed by exact filename and by (folder, kind, lecture number).
+
+    Lecture numbers are parsed once when a file is added, so fuzzy lookups for another
+    version of the same lecture are dictionary hits rather than scans over every file.
+    """
+
+    def __init__(self, files=()):
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_name: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_lecture: Dict[Tuple[str, str, int], List[Dict[str, Any]]] = {}
+        for file in files:
+            self.add(file)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    @staticmethod
+    def lecture_key(filename: str, folder_path: Optional[str]) -> Optional[Tuple[str, str, int]]:
+        folder = managed_folder(folder_path)
+        kind = MATERIAL_KINDS.get(folder)
+        lecture_num = parse_lecture_number(filename) if kind else None
+        return (folder, kind, lecture_num) if lecture_num is not None else None
+
+    def add(self, file: Dict[str, Any]) -> None:
+        self.remove(file['id'])
+        self.by_id[str(file['id'])] = file
+        self.by_name.setdefault(file['filename'], []).append(file)
+        key = self.lecture_key(file['filename'], file.get('folder_path'))
+        if key is not None:
+            self.by_lecture.setdefault(key, []).append(file)
+
+    def remove(self, file_id: Any) -> None:
+        old = self.by_id.pop(str(file_id), None)
+        if old is None:
+            return
+        lecture_key = self.lecture_key(old['filename'], old.get('folder_path'))
+        for table, key in ((self.by_name, old['filename']), (self.by_lecture, lecture_key)):
+            files = table.get(key)
+            if files is None:
+                continue
+            files[:] = [file for file in files if str(file['id']) != str(file_id)]
+            if not files:
+                del table[key]
+
+    def find(self, filename: str, folder_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the file with this name, or the newest file for the same lecture material."""
+        for file in reversed(self.by_name.get(filename, [])):
+            if not folder_path or folder_path in file.get('folder_path', ''):
+                return file
+
+        key = self.lecture_key(filename, folder_path)
+        matches = self.by_lecture.get(key) if key is not None else None
+        return matches[-1] if matches else None
+
+
+# "Lecture 3 - Slides", "Lecture 12 - Notes"
+LECTURE_ITEM_TITLE = re.compile(r'^Lecture (\d+) - (Slides|Notes)\b')
+
+
+class ModuleItemIndex:
+    """Items of one module, indexed by exact title and by (lecture number, material type).
+
+    Built once from the module's item list and updated in place as items are created or
+    deleted, so existence checks never re-list the module.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.by_title: Dict[str, Dict[str, Any]] = {}
+        self.by_lecture: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        for item in items:
+            self.add(item)
+
+    @staticmethod
+    def lecture_key(title: str) -> Optional[Tuple[int, str]]:
+        match = LECTURE_ITEM_TITLE.match(title)
+        return (int(match.group(1)), match.group(2)) if match else None
+
+    def add(self, item: Dict[str, Any]) -> None:
+        self.by_title.setdefault(item['title'], item)
+        key = self.lecture_key(item['title'])
+        if key is not None:
+            self.by_lecture.setdefault(key, item)
+
+    def remove(self, item_id: Any) -> None:
+        for table in (self.by_title, self.by_lecture):
+            for key, item in list(table.items()):
+                if str(item['id']) == str(item_id):
+                    del table[key]
+
+    def find(self, title: str) -> Optional[Dict[str, Any]]:
+        """Return the item with this title, or another item for the same lecture material."""
+        item = self.by_title.get(title)
+        if item is None:
+            key = self.lecture_key(title)
+            item = self.by_lecture.get(key) if key is not None else None
+        return item
+
+    def lecture_numbers(self, material_type: str) -> set:
+        return {num for num, kind in self.by_lecture if kind == material_type}
+
+
+def longest_increasing_subsequence(values: List[int]) -> List[int]:
+    """Return the indexes of one longest strictly increasing subsequence of `values`."""
+    tail_values: List[int] = []  # Smallest tail value of an increasing run of each length
+    tail_indexes: List[int] = []
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        length = bisect.bisect_left(tail_values, value)
+        if length:
+            previous[i] = tail_indexes[length - 1]
+        if length == len(tail_values):
+            tail_values.append(value)
+            tail_indexes.append(i)
+        else:
+            tail_values[length] = value
+            tail_indexes[length] = i
+
+    run = []
+    i = tail_indexes[-1] if tail_indexes else -1
+    while i != -1:
+        run.append(i)
+        i = previous[i]
+    return run[::-1]
+
+
+def minimal_moves(current: List[Any], desired: List[Any]) -> List[Tuple[Any, int]]:
+    """Moves that reorder `current` into `desired`, as (element, 1-based position) pairs.
+
+    Elements on a longest increasing subsequence (by desired rank) stay where they are;
+    every other element is moved once, to just after its predecessor in `desired`. A move
+    takes the element out and re-inserts it at the position, as Canvas does.
+    """
+    rank = {element: i for i, element in enumerate(desired)}
+    ranks = [rank[element] for element in current]
+    keep = {current[i] for i in longest_increasing_subsequence(ranks)}
+
+    order = list(current)
+    moves = []
+    for i, element in enumerate(desired):
+        if element in keep:
+            continue
+        order.remove(element)
+        position = order.index(desired[i - 1]) + 2 if i else 1
+        order.insert(position - 1, element)
+        moves.append((element, position))
+    return moves
+
+
+def file_sha256(filepath: str, chunk_size: int = 1 << 20) -> str:
+    """Return the hex sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentHashIndex:
+    """Local index of file content hashes and the Canvas file each file was uploaded as.
+
+    Size and mtime are kept as a fast pre-check so unchanged files are not re-hashed.
+    """
+
+    VERSION = 1
+
+    def __init__(self, state_dir: str, course_id: str):
+        self.path = Path(state_dir) / f"hashes_{course_id}.json"
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.VERSION:
+            return False
+        self.entries = data.get('files', {})
+        return True
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(filepath: str) -> str:
+        return Path(filepath).as_posix()
+
+    def digest(self, filepath: str) -> str:
+        """Return the sha256 of a local file, re-hashing only if its size or mtime changed."""
+        stat = os.stat(filepath)
+        entry = self.entries.setdefault(self._key(filepath), {})
+        if entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=file_sha256(filepath))
+        return entry['sha256']
+
+    def uploaded(self, filepath: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for a file previously uploaded to Canvas, if any."""
+        entry = self.entries.get(self._key(filepath))
+        return entry if entry and entry.get('file_id') is not None else None
+
+    def record_upload(self, filepath: str, file_id: Any, sha256: str) -> None:
+        entry = self.entries.setdefault(self._key(filepath), {})
+        entry.update(file_id=file_id, uploaded_sha256=sha256)
+
+    def rename(self, old_path: str, new_path: str) -> None:
+        """Carry a file's upload record over to its new path."""
+        entry = self.entries.pop(self._key(old_path), None)
+        if entry is not None:
+            self.entries[self._key(new_path)] = entry
+
+    def forget(self, filepath: str) -> None:
+        self.entries.pop(self._key(filepath), None)
+
+
+class PdfOptimizer:
+    """Shrink PDFs before upload, keeping each result in a content-addressed cache.
+
+    Ghostscript recompresses the PDF with embedded images downsampled to `dpi` and writes
+    out only the objects still in use. The result is linearized for fast web view, by qpdf
+    when it is installed, otherwise by Ghostscript itself. Results are keyed by the source
+    sha256 and the settings, so each PDF is optimized once; when the result is no smaller
+    than the source, that is cached too and the source is uploaded as is.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_dir: str, dpi: int = 150, ghostscript: Optional[str] = None,
+                 qpdf: Optional[str] = None):
+        self.cache_dir = Path(cache_dir)
+        self.dpi = dpi
+        self.ghostscript = ghostscript or shutil.which('gs') or shutil.which('gswin64c')
+        self.qpdf = qpdf or shutil.which('qpdf')
+
+    @property
+    def available(self) -> bool:
+        return self.ghostscript is not None
+
+    def _key(self, digest: str) -> str:
+        settings = f"v{self.VERSION} dpi={self.dpi} linearize={'qpdf' if self.qpdf else 'gs'}"
+        return hashlib.sha256(f"{digest} {settings}".encode()).hexdigest()
+
+    def cached(self, digest: str) -> Optional[Path]:
+        """Return the cached optimized copy of a PDF with this sha256, if there is one."""
+        artifact = self.cache_dir / f"{self._key(digest)}.pdf"
+        return artifact if artifact.exists() else None
+
+    def optimize(self, filepath: str, digest: str) -> str:
+        """Return the path to upload for a local file: its optimized copy or the file itself."""
+        if not self.available or not filepath.lower().endswith('.pdf'):
+            return filepath
+        key = self._key(digest)
+        artifact = self.cache_dir / f"{key}.pdf"
+        keep_original = self.cache_dir / f"{key}.original"
+        if artifact.exists():
+            return str(artifact)
+        if keep_original.exists():
+            return filepath
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Unique scratch names, so concurrent uploads of identical PDFs do not collide
+        scratch = self.cache_dir / f"{key}.{uuid.uuid4().hex}"
+        rewritten, linearized = scratch.with_suffix('.gs.tmp'), scratch.with_suffix('.qpdf.tmp')
+        try:
+            subprocess.run([
+                self.ghostscript, '-q', '-dSAFER', '-dBATCH', '-dNOPAUSE', '-sDEVICE=pdfwrite',
+                '-dCompatibilityLevel=1.5', '-dDetectDuplicateImages=true', '-dCompressFonts=true',
+                '-dDownsampleColorImages=true', f'-dColorImageResolution={self.dpi}',
+                '-dDownsampleGrayImages=true', f'-dGrayImageResolution={self.dpi}',
+                '-dDownsampleMonoImages=true', f'-dMonoImageResolution={self.dpi * 2}',
+                f'-dFastWebView={"false" if self.qpdf else "true"}',
+                f'-sOutputFile={rewritten}', filepath,
+            ], capture_output=True, check=True)
+            result = rewritten
+            if self.qpdf:
+                # Exit status 3 means qpdf succeeded with warnings
+                completed = subprocess.run([
+                    self.qpdf, '--linearize', '--object-streams=generate',
+                    '--remove-unreferenced-resources=yes', str(rewritten), str(linearized),
+                ], capture_output=True)
+                if completed.returncode not in (0, 3):
+                    raise subprocess.CalledProcessError(completed.returncode, completed.args,
+                                                        completed.stdout, completed.stderr)
+                result = linearized
+
+            if result.stat().st_size < os.path.getsize(filepath):
+                os.replace(result, artifact)
+                return str(artifact)
+            keep_original.touch()
+            return filepath
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Could not optimize {filepath} ({e}), uploading it as is")
+            return filepath
+        finally:
+            for tmp_path in (rewritten, linearized):
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
+
+def git_head() -> Optional[str]:
+    """Return the commit checked out in the current directory, if it is a git work tree."""
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class ChangeSet:
+    """Managed paths added, modified, renamed or deleted since a base commit, or seen by the
+    file watcher. Paths are relative to the current directory.
+    """
+
+    def __init__(self, base: str):
+        self.base = base  # Commit, or a description of where the changes came from
+        self.changed: set = set()  # Added or modified
+        self.renamed: Dict[str, str] = {}  # New path -> old path
+        self.deleted: set = set()
+
+    def __len__(self) -> int:
+        return len(self.changed) + len(self.renamed) + len(self.deleted)
+
+    def touches(self, path: str) -> bool:
+        path = Path(path).as_posix()
+        return path in self.changed or path in self.renamed
+
+    @classmethod
+    def from_git(cls, base: str, folders=MANAGED_FOLDERS) -> Optional['ChangeSet']:
+        """Diff the working tree against `base`. Returns None if git cannot (e.g. unknown commit).
+
+        The working tree is compared, so uncommitted and untracked files are included when
+        syncing by hand.
+        """
+        def git(*args: str) -> List[str]:
+            result = subprocess.run(['git', *args], capture_output=True, text=True, check=True)
+            return [field for field in result.stdout.split('\0') if field]
+
+        try:
+            git('rev-parse', '--verify', '--quiet', f'{base}^{{commit}}')
+            fields = git('diff', '--name-status', '-z', '-M', '--relative', base, '--', *folders)
+            untracked = git('ls-files', '-z', '--others', '--exclude-standard', '--', *folders)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+        changes = cls(base)
+        while fields:
+            status = fields.pop(0)
+            if status[0] in 'RC':
+                old_path, new_path = fields.pop(0), fields.pop(0)
+                if status[0] == 'R':
+                    changes.renamed[new_path] = old_path
+                else:
+                    changes.changed.add(new_path)
+            elif status[0] == 'D':
+                changes.deleted.add(fields.pop(0))
+            else:
+                changes.changed.add(fields.pop(0))
+        changes.changed.update(untracked)
+        return changes
+
+    @classmethod
+    def from_events(cls, events: List[Tuple[str, str, int]]) -> 'ChangeSet':
+        """Fold watcher events, (kind, path, cookie) in order, into one change set.
+
+        Kinds are 'changed', 'deleted', 'moved_from' and 'moved_to'; a moved_from/moved_to
+        pair sharing a cookie is a rename.
+        """
+        changes = cls("file watcher")
+        moved_from: Dict[int, str] = {}
+        for kind, path, cookie in events:
+            if kind == 'moved_from':
+                moved_from[cookie] = path
+                kind = 'deleted'
+            elif kind == 'moved_to' and cookie in moved_from:
+                old_path = moved_from.pop(cookie)
+                changes.deleted.discard(old_path)
+                changes.changed.discard(old_path)
+                changes.renamed[path] = changes.renamed.pop(old_path, old_path)
+                continue
+            if kind == 'deleted':
+                changes.changed.discard(path)
+                changes.renamed.pop(path, None)
+                changes.deleted.add(path)
+            else:
+                changes.deleted.discard(path)
+                if path not in changes.renamed:
+                    changes.changed.add(path)
+        return changes
+
+
+def _ignored(name: str) -> bool:
+    # Editor swap files, partial downloads and other scratch files never trigger a sync
+    return name.startswith(('.', '~')) or name.endswith(('~', '.tmp', '.part', '.crdownload'))
+
+
+class InotifyWatcher:
+    """Linux inotify watch on a set of folders, through libc via ctypes."""
+
+    name = "inotify"
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE
+        self.folders: Dict[int, str] = {}
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+            self.folders[wd] = Path(folder).as_posix()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def read(self, timeout: Optional[float]) -> Optional[List[Tuple[str, str, int]]]:
+        """Wait up to `timeout` seconds for events. Returns None if the kernel dropped events."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            if not name or _ignored(name) or wd not in self.folders:
+                continue
+            path = f"{self.folders[wd]}/{name}"
+            if mask & self.IN_MOVED_FROM:
+                events.append(('moved_from', path, cookie))
+            elif mask & self.IN_MOVED_TO:
+                events.append(('moved_to', path, cookie))
+            elif mask & self.IN_DELETE:
+                events.append(('deleted', path, 0))
+            else:
+                events.append(('changed', path, 0))
+        return events
+
+
+class PollingWatcher:
+    """Portable fallback that compares (mtime, size, inode) snapshots of the folders.
+
+    A path that disappears while a new path appears with its inode is reported as a move.
+    """
+
+    name = "polling"
+
+    def __init__(self, folders, interval: float = 1.0):
+        self.folders = [Path(folder) for folder in folders]
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def close(self) -> None:
+        pass
+
+    def _scan(self) -> Dict[str, Tuple[int, int, int]]:
+        snapshot = {}
+        for folder in self.folders:
+            for entry in os.scandir(folder) if folder.is_dir() else ():
+                if entry.is_file() and not _ignored(entry.name):
+                    stat = entry.stat()
+                    snapshot[f"{folder.as_posix()}/{entry.name}"] = (stat.st_mtime_ns, stat.st_size,
+                                                                     stat.st_ino)
+        return snapshot
+
+    def _diff(self, snapshot: Dict[str, Tuple[int, int, int]]) -> List[Tuple[str, str, int]]:
+        gone = {self.snapshot[path][2]: path for path in self.snapshot if path not in snapshot}
+        events = []
+        for path, sig in snapshot.items():
+            if path not in self.snapshot and sig[2] in gone:
+                events += [('moved_from', gone.pop(sig[2]), sig[2]), ('moved_to', path, sig[2])]
+            elif self.snapshot.get(path) != sig:
+                events.append(('changed', path, 0))
+        return events + [('deleted', path, 0) for path in gone.values()]
+
+    def read(self, timeout: Optional[float]) -> List[Tuple[str, str, int]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            time.sleep(max(0.0, wait))
+            snapshot = self._scan()
+            events = self._diff(snapshot)
+            self.snapshot = snapshot
+            if events or (deadline is not None and time.monotonic() >= deadline):
+                return events
+
+
+def open_watcher(folders, polling: bool = False, poll_interval: float = 1.0):
+    """Watch folders with inotify where available, else by polling."""
+    if not polling and hasattr(os, 'O_CLOEXEC'):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling every {poll_interval}s instead")
+    return PollingWatcher(folders, poll_interval)
+
+
+def watch_materials(sync: Callable[[Optional[ChangeSet]], Any], folders=MANAGED_FOLDERS,
+                    debounce: float = 2.0, polling: bool = False, poll_interval: float = 1.0) -> None:
+    """Run `sync` for each burst of file changes until interrupted.
+
+    Events are collected until the folders have been quiet for `debounce` seconds, then
+    synced as one batch containing just the touched paths. If the watcher lost events,
+    `sync` is called with None to sync everything.
+    """
+    folders = [folder for folder in folders if Path(folder).is_dir()]
+    if not folders:
+        raise FileNotFoundError("None of the course material folders exist here")
+    watcher = open_watcher(folders, polling=polling, poll_interval=poll_interval)
+    print(f"Watching {', '.join(folders)} ({watcher.name}); press Ctrl+C to stop")
+    try:
+        while True:
+            events = watcher.read(None)
+            overflow = events is None
+            while events:
+                more = watcher.read(debounce)
+                if more is None:
+                    overflow = True
+                    break
+                if not more:
+                    break
+                events.extend(more)
+
+            changes = None if overflow else ChangeSet.from_events(events or [])
+            if changes is not None and not len(changes):
+                continue
+            started = time.monotonic()
+            # Any failure ends only this batch; Ctrl+C (not an Exception) still stops watching
+            try:
+                sync(changes)
+            except requests.exceptions.RequestException as e:
+                print(f"Sync failed ({e}); waiting for the next change")
+                continue
+            except Exception:
+                print("Sync failed with an unexpected error; waiting for the next change")
+                traceback.print_exc()
+                continue
+            print(f"Synced in {time.monotonic() - started:.1f}s; watching for changes")
+    finally:
+        watcher.close()
+
+
+class SyncTracer:
+    """Timing events for every Canvas request and sync phase.
+
+    Each event is a dict. Events are kept in memory for the end-of-run summary, appended to
+    `trace_path` as JSON lines if given, and passed to `exporter` (any callable taking the
+    event) so they can be forwarded to a metrics system.
+    """
+
+    SLOWEST_FILES = 10
+
+    def __init__(self, trace_path: Optional[str] = None,
+                 exporter: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.exporter = exporter
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._trace = None
+        if trace_path:
+            Path(trace_path).parent.mkdir(parents=True, exist_ok=True)
+            self._trace = open(trace_path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        event = dict(event, ts=round(time.time(), 3))
+        with self._lock:
+            self.events.append(event)
+            if self._trace is not None:
+                self._trace.write(json.dumps(event) + "\n")
+                self._trace.flush()
+        if self.exporter is not None:
+            try:
+                self.exporter(event)
+            except Exception as e:
+                print(f"Metrics exporter failed: {e}")
+
+    @staticmethod
+    def endpoint(method: str, url: str, auth: bool = True) -> str:
+        """Group a request by route, e.g. "POST /api/v1/courses/:id/modules/:id/items"."""
+        if not auth:
+            # Pre-signed URLs: uploads, and downloads of files being compared
+            transfer = "file download" if method.upper() == 'GET' else "file upload"
+            return f"{method.upper()} ({transfer})"
+        path = re.sub(r'/\d+(?=/|$)', '/:id', urlparse(url).path)
+        return f"{method.upper()} {path}"
+
+    def request(self, method: str, url: str, auth: bool, attempt: int, seconds: float,
+                response: Optional[requests.Response] = None, error: Optional[str] = None) -> None:
+        """Record one HTTP attempt; retries are separate events with `attempt` > 0."""
+        event = {
+            'type': 'request',
+            'endpoint': self.endpoint(method, url, auth),
+            'attempt': attempt,
+            'seconds': round(seconds, 4),
+        }
+        if response is not None:
+            headers = response.headers
+            event.update(
+                status=response.status_code,
+                bytes_sent=int(response.request.headers.get('Content-Length') or 0),
+                # From the header, never the body: reading `content` would load a streamed
+                # download into memory. Chunked responses without a length count as 0.
+                bytes_received=int(headers.get('Content-Length') or 0),
+            )
+            if 'X-Request-Cost' in headers:
+                event['cost'] = float(headers['X-Request-Cost'])
+            if 'X-Rate-Limit-Remaining' in headers:
+                event['rate_limit_remaining'] = float(headers['X-Rate-Limit-Remaining'])
+        if error is not None:
+            event['error'] = error
+        self.emit(event)
+
+    @contextmanager
+    def phase(self, name: str, **fields):
+        """Time a sync phase (listing, hashing, upload, item creation, ...)."""
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.emit(dict(fields, type='phase', phase=name,
+                           seconds=round(time.monotonic() - started, 4), ok=ok))
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def print_summary(self) -> None:
+        """Print latency by endpoint, time by phase, the slowest files and run totals."""
+        with self._lock:
+            events = list(self.events)
+        requests_ = [e for e in events if e['type'] == 'request']
+        phases = [e for e in events if e['type'] == 'phase']
+
+        print("\n==== SYNC TIMING ====")
+        by_endpoint: Dict[str, List[Dict[str, Any]]] = {}
+        for event in requests_:
+            by_endpoint.setdefault(event['endpoint'], []).append(event)
+        print(f"{'endpoint':<56} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'retries':>7} {'errors':>6}")
+        for endpoint, group in sorted(by_endpoint.items(), key=lambda kv: -len(kv[1])):
+            latencies = [e['seconds'] * 1000 for e in group]
+            retries = sum(1 for e in group if e['attempt'])
+            errors = sum(1 for e in group if 'error' in e or e.get('status', 200) >= 400)
+            print(f"{endpoint:<56} {len(group):>6} {self._percentile(latencies, 50):>8.1f} "
+                  f"{self._percentile(latencies, 95):>8.1f} {retries:>7} {errors:>6}")
+
+        by_phase: Dict[str, List[float]] = {}
+        for event in phases:
+            by_phase.setdefault(event['phase'], []).append(event['seconds'])
+        if by_phase:
+            print(f"\n{'phase':<20} {'count':>6} {'total s':>9} {'p95 ms':>8}")
+            for name, durations in sorted(by_phase.items(), key=lambda kv: -sum(kv[1])):
+                print(f"{name:<20} {len(durations):>6} {sum(durations):>9.2f} "
+                      f"{self._percentile([d * 1000 for d in durations], 95):>8.1f}")
+
+        file_phases = [e for e in phases if 'path' in e]
+        if file_phases:
+            per_file: Dict[str, float] = {}
+            for event in file_phases:
+                per_file[event['path']] = per_file.get(event['path'], 0.0) + event['seconds']
+            print("\nSlowest files:")
+            for path, seconds in sorted(per_file.items(), key=lambda kv: -kv[1])[:self.SLOWEST_FILES]:
+                print(f"  {seconds:>8.2f}s  {path}")
+
+        sent = sum(e.get('bytes_sent', 0) for e in requests_)
+        received = sum(e.get('bytes_received', 0) for e in requests_)
+        cost = sum(e.get('cost', 0.0) for e in requests_)
+        retries = sum(1 for e in requests_ if e['attempt'])
+        print(f"\nTotal: {len(requests_)} requests ({retries} retries), "
+              f"{sent / 1e6:.2f} MB sent, {received / 1e6:.2f} MB received, "
+              f"rate-limit cost {cost:.1f}, {time.monotonic() - self._started:.1f}s elapsed")
+
+
+class RateLimitScheduler:
+    """Adaptive concurrency limit driven by Canvas's rate-limit headers.
+
+    Canvas meters each token with a leaky bucket, reporting what is left in
+    `X-Rate-Limit-Remaining` and what a request cost in `X-Request-Cost`. Thresholds are
+    fractions of the fullest bucket seen so far. Above `high_water` the scheduler adds a
+    concurrent slot. Below `low_water` it halves concurrency and pauses until the bucket has
+    refilled, so requests slow down before Canvas starts throttling.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        low_water: float = 0.3,
+        high_water: float = 0.7,
+        refill_rate: float = 10.0,
+        max_pause: float = 30.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.low_water = low_water
+        self.high_water = high_water
+        self.refill_rate = refill_rate
+        self.max_pause = max_pause
+        self.capacity = 0.0  # Fullest bucket seen
+        self.remaining: Optional[float] = None
+        self.cost = 1.0  # Moving average of X-Request-Cost
+        self.in_flight = 0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Hold one concurrent request slot, waiting for one if necessary."""
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.in_flight < self.limit:
+                    break
+                else:
+                    self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    @staticmethod
+    def _header(response: requests.Response, name: str) -> Optional[float]:
+        try:
+            return float(response.headers[name])
+        except (KeyError, ValueError):
+            return None
+
+    def observe(self, response: requests.Response, throttled: bool = False) -> None:
+        """Update the concurrency limit from a Canvas response."""
+        remaining = self._header(response, 'X-Rate-Limit-Remaining')
+        cost = self._header(response, 'X-Request-Cost')
+
+        with self._cond:
+            if cost is not None:
+                self.cost = 0.8 * self.cost + 0.2 * cost
+            if remaining is not None:
+                self.remaining = remaining
+
+            if throttled:
+                self.limit = 1
+                self._pause(self.high_water * self.capacity)
+            elif remaining is not None:
+                self.capacity = max(self.capacity, remaining)
+                low = self.low_water * self.capacity
+                if remaining < low:
+                    self.limit = max(1, self.limit // 2)
+                    # Leave room for the requests already in flight before sending more
+                    self._pause(low - remaining + self.cost * self.in_flight)
+                elif remaining > self.high_water * self.capacity and self.limit < self.max_concurrency:
+                    self.limit += 1
+            self._cond.notify_all()
+
+    def _pause(self, deficit: float) -> None:
+        resume_at = time.monotonic() + min(self.max_pause, deficit / self.refill_rate)
+        self._resume_at = max(self._resume_at, resume_at)
+
+
+class CanvasTransport:
+    """Pooled, retrying HTTP transport shared by every Canvas call.
+
+    Uses one keep-alive session so requests reuse TLS connections, retries throttling and
+    transient server errors with exponential backoff and jitter, honors `Retry-After`, and
+    applies a default timeout to every request.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    # POSTs create things, so only retry them when Canvas says it did not process the request
+    RETRY_STATUSES_UNSAFE = {429, 503}
+
+    def __init__(
+        self,
+        api_token: str,
+        pool_size: int = 10,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: Any = (10, 120),
+        scheduler: Optional[RateLimitScheduler] = None,
+        tracer: Optional[SyncTracer] = None,
+    ):
+        self.auth_headers = {'Authorization': f'Bearer {api_token}'}
+        self.scheduler = scheduler
+        self.tracer = tracer
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._prefetcher: Optional[ThreadPoolExecutor] = None
+        self._prefetcher_lock = threading.Lock()
+
+    def close(self) -> None:
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown(wait=True, cancel_futures=True)
+            self._prefetcher = None
+        self.session.close()
+
+    def _prefetch_pool(self) -> ThreadPoolExecutor:
+        with self._prefetcher_lock:
+            if self._prefetcher is None:
+                self._prefetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='canvas-prefetch')
+            return self._prefetcher
+
+    @staticmethod
+    def _is_throttled(response: requests.Response) -> bool:
+        # Canvas reports an exhausted rate-limit bucket as 403 rather than 429
+        return response.status_code == 403 and 'Rate Limit Exceeded' in response.text
+
+    def _should_retry(self, method: str, response: requests.Response) -> bool:
+        if self._is_throttled(response):
+            return True
+        statuses = self.RETRY_STATUSES_UNSAFE if method.upper() == 'POST' else self.RETRY_STATUSES
+        return response.status_code in statuses
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, when.timestamp() - time.time())
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent retries from hitting Canvas in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _rewind(kwargs: Dict[str, Any]) -> None:
+        bodies = [kwargs.get('data')]
+        for value in (kwargs.get('files') or {}).values():
+            bodies.append(value[1] if isinstance(value, tuple) else value)
+        for body in bodies:
+            if hasattr(body, 'seek'):
+                body.seek(0)
+
+    def request(self, method: str, url: str, auth: bool = True, **kwargs) -> requests.Response:
+        """Send a request, retrying transient failures. Callers still check the status.
+
+        `auth=False` leaves out the Canvas token, e.g. for pre-signed upload URLs. Those
+        requests do not count against the Canvas rate limit and bypass the scheduler.
+        """
+        headers = dict(self.auth_headers) if auth else {}
+        headers.update(kwargs.pop('headers', None) or {})
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self._send(method, url, auth, headers, kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if self.tracer is not None:
+                    self.tracer.request(method, url, auth, attempt, time.monotonic() - started,
+                                        error=type(e).__name__)
+                # A POST may have been processed before the connection broke; only retry
+                # it when the connection was never established
+                sent = not isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt >= self.max_retries or (sent and method.upper() == 'POST'):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if self.tracer is not None:
+                    self.tracer.request(method, url, auth, attempt, time.monotonic() - started, response)
+                if attempt >= self.max_retries or not self._should_retry(method, response):
+                    return response
+                retry_after = self._retry_after(response)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                delay = min(delay, self.backoff_max)
+                print(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+
+            attempt += 1
+            self._rewind(kwargs)
+            time.sleep(delay)
+
+    def _send(self, method: str, url: str, auth: bool, headers: Dict[str, str],
+              kwargs: Dict[str, Any]) -> requests.Response:
+        if not auth or self.scheduler is None:
+            return self.session.request(method, url, headers=headers, **kwargs)
+        with self.scheduler.slot():
+            response = self.session.request(method, url, headers=headers, **kwargs)
+        self.scheduler.observe(response, throttled=self._is_throttled(response))
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def paginate(self, url: str, params: Optional[Dict] = None,
+                 prefetch: bool = True) -> Iterator[Dict[str, Any]]:
+        """Yield the records of a Canvas list endpoint, following `Link: rel="next"` pages.
+
+        Pages are fetched lazily, so a consumer that stops iterating stops the fetching.
+        With `prefetch` the next page is requested in the background while the current one
+        is consumed; at most one page beyond the stopping point is then fetched.
+        """
+        def fetch(page_url: str, page_params: Optional[Dict]) -> requests.Response:
+            response = self.get(page_url, params=page_params)
+            response.raise_for_status()
+            return response
+
+        response = fetch(url, params)
+        pending = None
+        try:
+            while True:
+                next_url = response.links.get('next', {}).get('url')
+                if next_url and prefetch:
+                    pending = self._prefetch_pool().submit(fetch, next_url, None)
+                yield from response.json()
+                if not next_url:
+                    return
+                response = pending.result() if pending is not None else fetch(next_url, None)
+                pending = None
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+
+class MultipartFileStream:
+    """A multipart/form-data body that streams one file from disk in fixed-size chunks.
+
+    Peak memory stays at one chunk whatever the file size. The length is known up front, so
+    requests sends a Content-Length rather than a chunked body. `progress` is called with
+    (bytes sent, total bytes) as the body is read.
+    """
+
+    def __init__(
+        self,
+        fields: Dict[str, Any],
+        filepath: str,
+        filename: str,
+        file_field: str = 'file',
+        chunk_size: int = 1 << 20,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+        parts = []
+        for name, value in fields.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            )
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+        )
+        self._head = ''.join(parts).encode('utf-8')
+        self._tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        self._file = open(filepath, 'rb')
+        self._file_size = os.fstat(self._file.fileno()).st_size
+        self._length = len(self._head) + self._file_size + len(self._tail)
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __enter__(self) -> 'MultipartFileStream':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._length}[whence]
+        self._pos = max(0, min(self._length, base + offset))
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length - self._pos
+        chunks = []
+        while size > 0 and self._pos < self._length:
+            head_end = len(self._head)
+            file_end = head_end + self._file_size
+            if self._pos < head_end:
+                chunk = self._head[self._pos:self._pos + size]
+            elif self._pos < file_end:
+                self._file.seek(self._pos - head_end)
+                chunk = self._file.read(min(size, file_end - self._pos))
+            else:
+                start = self._pos - file_end
+                chunk = self._tail[start:start + size]
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+
+        if self.progress is not None:
+            self.progress(max(0, min(self._pos - len(self._head), self._file_size)), self._file_size)
+        return b''.join(chunks)
+
+    def __iter__(self):
+        self.seek(0)
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class SyncOperation:
+    """One step of a sync plan."""
+
+    # Canvas requests each action is expected to take
+    REQUEST_COST = {
+        'upload': 2,  # Initiate, then send the bytes
+        'replace': 2,
+        'rename': 1,
+        'create_module': 1,
+        'create_item': 1,
+        'move_item': 1,
+        'skip': 0,
+    }
+    FILE_ACTIONS = ('upload', 'replace', 'rename', 'skip')
+
+    def __init__(
+        self,
+        action: str,
+        path: Optional[str] = None,
+        folder: Optional[str] = None,
+        module: Optional[str] = None,
+        title: Optional[str] = None,
+        position: Optional[int] = None,
+        file: Optional[Dict[str, Any]] = None,
+        item: Optional[Dict[str, Any]] = None,
+        digest: Optional[str] = None,
+        detail: str = '',
+        adopt: bool = False,
+        changed: bool = False,
+    ):
+        self.action = action
+        self.path = path
+        self.folder = folder
+        self.module = module
+        self.title = title
+        self.position = position
+        self.file = file
+        self.item = item
+        self.digest = digest
+        self.detail = detail
+        self.adopt = adopt  # Skip that records an existing Canvas file as this file's upload
+        self.changed = changed  # Rename whose content also changed
+
+    @property
+    def key(self) -> Tuple:
+        if self.action in self.FILE_ACTIONS:
+            return ('file', self.path)
+        if self.item is not None:
+            # Existing items are told apart by ID, as a module can repeat a title
+            return (self.action, self.module, self.item['id'])
+        return (self.action, self.module, self.title)
+
+    @property
+    def requests(self) -> int:
+        if self.action == 'rename' and self.changed:
+            return self.REQUEST_COST['rename'] + self.REQUEST_COST['replace']
+        return self.REQUEST_COST[self.action]
+
+    def describe(self) -> str:
+        if self.action in self.FILE_ACTIONS:
+            text = f"{self.action:<13} {self.path} -> {self.folder}"
+        elif self.action == 'create_module':
+            text = f"{self.action:<13} {self.module} @ {self.position}"
+        else:
+            where = self.position if self.position is not None else 'end'
+            text = f"{self.action:<13} {self.title} @ {where} ({self.module})"
+        return f"{text} [{self.detail}]" if self.detail else text
+
+
+class SyncPlan:
+    """Ordered, de-duplicated operations that bring Canvas in line with the local files."""
+
+    def __init__(self):
+        self.operations: List[SyncOperation] = []
+        self._keys = set()
+
+    def add(self, op: SyncOperation) -> SyncOperation:
+        if op.key not in self._keys:
+            self._keys.add(op.key)
+            self.operations.append(op)
+        return op
+
+    def file_operations(self) -> List[SyncOperation]:
+        return [op for op in self.operations if op.action in SyncOperation.FILE_ACTIONS]
+
+    def module_operations(self) -> List[SyncOperation]:
+        return [op for op in self.operations if op.action not in SyncOperation.FILE_ACTIONS]
+
+    @property
+    def estimated_requests(self) -> int:
+        return sum(op.requests for op in self.operations)
+
+    def print(self) -> None:
+        changes = [op for op in self.operations if op.action != 'skip']
+        skipped = len(self.operations) - len(changes)
+        print("\n==== SYNC PLAN ====")
+        for op in changes:
+            print(f"  {op.describe()}")
+        if not changes:
+            print("  Nothing to change.")
+        print(f"{len(changes)} operations, {skipped} files unchanged, "
+              f"about {self.estimated_requests} Canvas requests")
+
+
+class FileRelay:
+    """Hands files uploaded to one course over to the syncs of other courses.
+
+    The source course announces which local paths it will upload (`expect`) and publishes
+    each resulting Canvas file. Other courses `wait` for a path and copy that file
+    server-side instead of uploading the bytes again. Waiting never blocks on a path the
+    source will not upload, or once the source sync has finished.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._expected: Optional[set] = None
+        self._files: Dict[str, Optional[Tuple[Dict[str, Any], str]]] = {}
+        self._closed = False
+
+    def expect(self, paths) -> None:
+        with self._cond:
+            self._expected = {Path(path).as_posix() for path in paths}
+            self._cond.notify_all()
+
+    def publish(self, path: str, file: Optional[Dict[str, Any]], digest: Optional[str] = None) -> None:
+        """Publish the Canvas file for a path, or None if its upload failed."""
+        with self._cond:
+            self._files[Path(path).as_posix()] = (file, digest) if file is not None else None
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def wait(self, path: str, digest: str) -> Optional[Dict[str, Any]]:
+        """Return the source course's file for `path` if it has the same content."""
+        key = Path(path).as_posix()
+        with self._cond:
+            while key not in self._files and not self._closed:
+                if self._expected is not None and key not in self._expected:
+                    return None
+                self._cond.wait()
+            published = self._files.get(key)
+        if published is None or published[1] != digest:
+            return None
+        return published[0]
+
+
 class CanvasIntegrator:
     def __init__(
         self,
@@ -19,320 +1454,661 @@ class CanvasIntegrator:
         base_url: str = "https://ucsb.instructure.com",
         public_site_base_url: Optional[str] = None,
         syllabus_filename: str = "syllabus.pdf",
+        state_dir: str = ".canvas_sync",
+        full_refresh: bool = False,
+        transport: Optional[CanvasTransport] = None,
+        max_workers: int = 4,
+        upload_progress: Optional[Callable[[str, int, int], None]] = None,
+        upload_retries: int = 3,
+        tracer: Optional[SyncTracer] = None,
+        use_graphql: bool = False,
+        pdf_optimizer: Optional[PdfOptimizer] = None,
     ):
         self.api_token = api_token
         self.course_id = str(course_id)
         self.base_url = base_url.rstrip('/')
         self.public_site_base_url = (public_site_base_url or "").rstrip('/')
         self.syllabus_filename = syllabus_filename
-        self.headers = {
-            'Authorization': f'Bearer {api_token}'
-        }
+        self.max_workers = max(1, max_workers)
+        self.http = transport or CanvasTransport(
+            api_token,
+            pool_size=max(10, self.max_workers * 2),
+            scheduler=RateLimitScheduler(self.max_workers),
+        )
+        self.tracer = tracer or SyncTracer()
+        if self.http.tracer is None:
+            self.http.tracer = self.tracer
+        self._lock = threading.RLock()  # Guards the caches when uploads run concurrently
+        self.upload_progress = upload_progress  # Called with (filename, bytes sent, total bytes)
+        self.upload_retries = upload_retries
         self._modules = {}  # Cache for created modules
-        self._files_cache = {}  # Cache for existing files
+        self._file_index = FileIndex()  # Known Canvas files
+        self._listed_folders = set()  # Folders listed directly this run
+        self._folders_complete = False  # Whether every Canvas folder is in the manifest
+        self._modules_reconciled = False  # Whether the manifest's modules match Canvas this run
+        self.use_graphql = use_graphql
+        self.pdf_optimizer = pdf_optimizer
+        self._pdf_savings: List[Tuple[str, int, int]] = []  # (path, source bytes, uploaded bytes)
+        self.relay_to: Optional[FileRelay] = None  # Publishes this course's uploads to other courses
+        self.relay_from: Optional[FileRelay] = None  # Copies uploads from another course
+        self._item_indexes: Dict[str, ModuleItemIndex] = {}  # Module ID -> item index
+        self.full_refresh = full_refresh
+        self.state = CanvasStateManifest(state_dir, self.course_id)
+        # Without a saved manifest, whatever a journal replays is no baseline for an
+        # incremental listing, so the first refresh must be a full one
+        self._manifest_loaded = self.state.load()
+        if self._manifest_loaded:
+            self._rebuild_file_index()
+        self.hashes = ContentHashIndex(state_dir, self.course_id)
+        self.hashes.load()
+        self.journal = SyncJournal(state_dir, self.course_id)
+        self._replay_journal()
+
+    def _replay_journal(self) -> None:
+        """Apply operations journaled by an interrupted sync to the manifest and hash index."""
+        entries = self.journal.entries()
+        for entry in entries:
+            op = entry['op']
+            if op == 'file':
+                if entry.get('replaced') is not None:
+                    self.state.forget_file(entry['replaced'])
+                self.state.record_file(entry['file'])
+                self.hashes.record_upload(entry['path'], entry['file']['id'], entry['sha256'])
+            elif op == 'module':
+                self.state.record_module(entry['module'])
+                self.state.module_items.setdefault(str(entry['module']['id']), [])
+            elif op == 'item':
+                self.state.forget_module_item(entry['module_id'], entry['item']['id'])
+                self.state.record_module_item(entry['module_id'], entry['item'])
+            elif op == 'move':
+                self.state.move_module_item(entry['module_id'], entry['item_id'], entry['position'])
+            elif op == 'delete_item':
+                self.state.forget_module_item(entry['module_id'], entry['item_id'])
+            elif op == 'delete_module':
+                self.state.forget_module(entry['module_id'])
+            elif op == 'delete_file':
+                self.state.forget_file(entry['file_id'])
+        if entries:
+            print(f"Resumed {len(entries)} operations from an interrupted sync ({self.journal.path})")
+            self._rebuild_file_index()
+
+    def _journal_file(self, path: str, file: Dict[str, Any], sha256: str,
+                      replaced: Optional[Any] = None) -> None:
+        self.journal.append('file', path=Path(path).as_posix(), file=file, sha256=sha256,
+                            replaced=replaced)
+
+    def _rebuild_file_index(self) -> None:
+        self._file_index = FileIndex(self.state.files.values())
+
+    def _remember_file(self, file: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a Canvas file in the manifest and the filename cache.
+
+        Canvas file objects only carry a `folder_id`, so the folder path is filled in from
+        the manifest's folder listing (refreshed if the folder is new to us).
+        """
+        if 'folder_id' in file and 'folder_path' not in file:
+            if self.state.folder_path(file['folder_id']) is None:
+                self._reconcile_folders()
+            folder_path = self.state.folder_path(file['folder_id'])
+            if folder_path is not None:
+                file = dict(file, folder_path=folder_path)
+
+        # Only the managed folders directly below the root, not e.g. "lecture_slides_old"
+        # or "archive/lecture_slides"
+        path = file.get('folder_path', '')
+        if managed_folder(path) == path.partition('/')[2]:
+            file = self.state.record_file(file)
+        else:
+            self.state.forget_file(file['id'])
+        self._file_index.add(file)
+        return file
+
+    def _reconcile_folders(self) -> None:
+        url = f"{self.base_url}/api/v1/courses/{self.course_id}/folders"
+        for folder in self.http.paginate(url, {'per_page': 100}):
+            self.state.record_folder(folder)
+        self._folders_complete = True
+
+    def resolve_folder(self, folder_path: str, create: bool = True) -> Optional[Dict[str, Any]]:
+        """Return the Canvas folder at a path below the course files root.
+
+        The folder is looked up in the state manifest first, then by path in Canvas, and is
+        created when missing (unless `create` is false, in which case None is returned).
+        Resolved folders are recorded in the manifest, so each path is looked up once.
+        """
+        path = folder_path.strip('/')
+        with self._lock:
+            folder = self.state.folder_by_path(path)
+            if folder is not None:
+                return folder
+
+            if not self._folders_complete:
+                url = f"{self.base_url}/api/v1/courses/{self.course_id}/folders/by_path/{path}"
+                response = self.http.get(url)
+                if response.status_code != 404:
+                    response.raise_for_status()
+                    # Canvas returns every folder from the root down to the requested one
+                    for folder in response.json():
+                        self.state.record_folder(folder)
+                    return self.state.folder_by_path(path)
+
+            if not create:
+                return None
+            parent, _, name = path.rpartition('/')
+            url = f"{self.base_url}/api/v1/courses/{self.course_id}/folders"
+            response = self.http.post(url, data={'name': name, 'parent_folder_path': parent or '/'})
+            response.raise_for_status()
+            self.state.record_folder(response.json())
+            print(f"Created Canvas folder {path}")
+            return self.state.folder_by_path(path)
+
+    def _reconcile_files(self, full: bool) -> int:
+        """Fetch files changed since the manifest watermark (or all managed files on a full refresh).
+
+        Files are listed newest-first, so an incremental pass stops at the first file older
+        than the watermark and usually costs a single request. A full refresh lists only
+        the managed folders rather than every file in the course.
+        """
+        watermark = None if full else self.state.files_watermark
+        newest = watermark
+        seen = set()
+
+        if full:
+            listings = []
+            for name in MANAGED_FOLDERS:
+                folder = self.state.folder_by_path(name)
+                if folder is not None:
+                    url = f"{self.base_url}/api/v1/folders/{folder['id']}/files"
+                    listings.append((url, {'per_page': 100}, folder['full_name']))
+        else:
+            url = f"{self.base_url}/api/v1/courses/{self.course_id}/files"
+            listings = [(url, {'per_page': 100, 'sort': 'updated_at', 'order': 'desc'}, None)]
+
+        for url, params, folder_path in listings:
+            # An incremental pass usually ends on the first page, so only prefetch on full listings
+            for file in self.http.paginate(url, params, prefetch=full):
+                stamp = file.get('updated_at') or ''
+                if watermark and stamp < watermark:
+                    break
+                if folder_path is not None:
+                    file = dict(file, folder_path=folder_path)
+                self._remember_file(file)
+                seen.add(str(file['id']))
+                if stamp > (newest or ''):
+                    newest = stamp
+
+        if full:
+            for file_id in list(self.state.files):
+                if file_id not in seen:
+                    self.state.forget_file(file_id)
+        self.state.files_watermark = newest
+        return len(seen)
+
+    def _catch_up_files(self) -> None:
+        """List this run's own uploads, copies and renames after applying a plan.
+
+        The watermark only ever comes from listings, so a file another client writes while
+        this run is uploading is never skipped. Listing once more here, down to the
+        watermark, moves it past this run's writes; otherwise the next run would page
+        through them, e.g. every file of a first sync into an empty course.
+        """
+        try:
+            with self.tracer.phase('list'):
+                self._reconcile_files(full=False)
+        except requests.exceptions.RequestException as e:
+            print(f"Could not list the files this sync wrote ({e}); the next sync will")
+
+    def _reconcile_modules(self, full: bool) -> None:
+        """Refresh the module list; re-list items only for modules whose item count changed."""
+        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules"
+        modules = list(self.http.paginate(url, {'per_page': 100}))
+
+        for module in modules:
+            module_id = str(module['id'])
+            known = self.state.modules.get(module_id)
+            stale = (
+                full
+                or known is None
+                or module_id not in self.state.module_items
+                or known.get('items_count') != module.get('items_count')
+            )
+            self.state.record_module(module)
+            if stale:
+                self.state.set_module_items(module_id, self._fetch_module_items(module_id))
+
+        listed = {str(module['id']) for module in modules}
+        for module_id in list(self.state.modules):
+            if module_id not in listed:
+                self.state.forget_module(module_id)
+
+    # One query returns every module with its items in order. Cursor pagination covers
+    # courses with more modules than fit in one page. Item titles are read from the
+    # module item itself: the content's title is the file's display name, which can differ.
+    MODULES_QUERY = """
+    query CourseModules($courseId: ID!, $cursor: String) {
+      course(id: $courseId) {
+        modulesConnection(first: 50, after: $cursor) {
+          pageInfo { hasNextPage endCursor }
+          nodes {
+            _id
+            name
+            position
+            moduleItems {
+              _id
+              title
+              content {
+                __typename
+                ... on File { _id }
+                ... on ExternalUrl { url }
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+
+    def _reconcile_modules_graphql(self) -> bool:
+        """Load every module and its items through `/api/graphql` in one or a few requests.
+
+        Returns False, leaving the manifest untouched, when GraphQL is unavailable or the
+        query fails, so the caller can fall back to REST.
+        """
+        url = f"{self.base_url}/api/graphql"
+        modules, cursor = [], None
+        try:
+            while True:
+                response = self.http.post(url, json={
+                    'query': self.MODULES_QUERY,
+                    'variables': {'courseId': self.course_id, 'cursor': cursor},
+                })
+                response.raise_for_status()
+                body = response.json()
+                if body.get('errors'):
+                    raise ValueError(body['errors'][0].get('message', 'query failed'))
+                connection = body['data']['course']['modulesConnection']
+                modules.extend(self._graphql_module(node) for node in connection['nodes'])
+                if not connection['pageInfo']['hasNextPage']:
+                    break
+                cursor = connection['pageInfo']['endCursor']
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"GraphQL state load failed ({e!r}), using the REST API")
+            return False
+
+        # Only replace the manifest's modules once every page has been parsed
+        self.state.modules, self.state.module_items = {}, {}
+        for module, items in modules:
+            self.state.record_module(module)
+            self.state.set_module_items(module['id'], items)
+        return True
+
+    @staticmethod
+    def _graphql_module(node: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Turn a module node into a manifest module and its items, shaped like REST's.
+
+        Raises ValueError, KeyError or TypeError on a node that cannot be read.
+        """
+        items = []
+        for position, node_item in enumerate(node.get('moduleItems') or [], start=1):
+            if node_item.get('title') is None:
+                raise ValueError("module items without titles")
+            content = node_item.get('content') or {}
+            item = {
+                'id': int(node_item['_id']),
+                'title': node_item['title'],
+                'type': content.get('__typename'),
+                'position': position,
+            }
+            # A File item whose file is gone has no content ID
+            if content.get('__typename') == 'File' and content.get('_id') is not None:
+                item['content_id'] = int(content['_id'])
+            if content.get('url'):
+                item['external_url'] = content['url']
+            items.append(item)
+        module = {'id': int(node['_id']), 'name': node['name'], 'position': node['position'],
+                  'items_count': len(items)}
+        return module, items
+
+    def refresh_state(self, full: bool = False) -> None:
+        """Bring the state manifest up to date with Canvas.
+
+        With an existing manifest only changes since the last run are fetched. A full
+        refresh (or a missing manifest) re-lists everything and drops deleted objects.
+        """
+        full = full or self.state.is_empty or not self._manifest_loaded
+        if full:
+            print("Refreshing full Canvas state...")
+            self.state.reset()
+            self._reconcile_folders()
+        else:
+            print(f"Reconciling Canvas state from {self.state.path}...")
+
+        changed_files = self._reconcile_files(full)
+        if not (self.use_graphql and self._reconcile_modules_graphql()):
+            self.use_graphql = False  # Don't retry GraphQL on later refreshes this run
+            self._reconcile_modules(full)
+        self._modules_reconciled = True
+        self._rebuild_file_index()
+        self._item_indexes = {}
+        self._listed_folders = set(MANAGED_FOLDERS)
+        self._manifest_loaded = True
+        print(f"State: {len(self.state.files)} files, {len(self.state.modules)} modules "
+              f"({changed_files} files fetched)")
 
     def get_or_create_module(self, name: str, position: Optional[int] = None) -> Dict:
         """Get existing module or create a new one."""
         if name in self._modules:
             return self._modules[name]
 
-        # List existing modules
-        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-
-        # Check if module exists
-        for module in response.json():
+        for module in self.state.modules.values():
             if module['name'] == name:
                 self._modules[name] = module
                 return module
 
+        # List existing modules, unless the manifest was just reconciled with Canvas
+        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules"
+        if not self._modules_reconciled:
+            for module in self.http.paginate(url, {'per_page': 100}):
+                if module['name'] == name:
+                    self.state.record_module(module)
+                    self._modules[name] = module
+                    return module
+
         # Create new module if it doesn't exist
         data = {'module[name]': name}
         if position is not None:
             data['module[position]'] = position
 
-        response = requests.post(url, headers=self.headers, data=data)
+        response = self.http.post(url, data=data)
         response.raise_for_status()
         module = response.json()
+        self.journal.append('module', module=module)
+        self.state.record_module(module)
+        self.state.set_module_items(module['id'], [])
         self._modules[name] = module
         return module
 
+    def iter_files_in_folder(self, folder_path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the files in a folder (or the whole course) as pages arrive, caching each one."""
+        if not folder_path:
+            url = f"{self.base_url}/api/v1/courses/{self.course_id}/files"
+            for file in self.http.paginate(url, {'per_page': 100}):
+                yield self._remember_file(file)
+            return
+
+        folder = self.resolve_folder(folder_path, create=False)
+        if folder is None:
+            return
+        url = f"{self.base_url}/api/v1/folders/{folder['id']}/files"
+        for file in self.http.paginate(url, {'per_page': 100}):
+            yield self._remember_file(dict(file, folder_path=folder['full_name']))
+
     def get_files_in_folder(self, folder_path: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get all files in a specific folder path."""
-        url = f"{self.base_url}/api/v1/courses/{self.course_id}/files"
-        params = {'per_page': 100}
-        if folder_path:
-            params['search_term'] = folder_path
-
-        all_files = []
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        files = response.json()
-        all_files.extend(files)
-
-        # Handle pagination if needed
-        while 'next' in response.links:
-            response = requests.get(response.links['next']['url'], headers=self.headers)
-            response.raise_for_status()
-            files = response.json()
-            all_files.extend(files)
-
-        # Cache files by name for quick lookup
-        for file in all_files:
-            self._files_cache[file['filename']] = file
-
-        return all_files
+        return list(self.iter_files_in_folder(folder_path))
 
     def get_file_by_name(self, filename: str, folder_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Get a file by its name, optionally filtering by folder path.
 
-        For lecture materials, also tries to find files with similar names to prevent duplicates.
+        For lecture materials, also finds other files for the same lecture to prevent duplicates.
+        """
+        file = self._file_index.find(filename, folder_path)
+
+        # Without a reconciled state, list the folder until the file turns up. Only a
+        # complete listing can rule out (or fuzzily match) a file, so only that is remembered.
+        if file is None and folder_path not in self._listed_folders:
+            for listed in self.iter_files_in_folder(folder_path):
+                if listed['filename'] == filename:
+                    break
+            else:
+                self._listed_folders.add(folder_path)
+            file = self._file_index.find(filename, folder_path)
+
+        if file is not None and file['filename'] != filename:
+            print(f"Found similar file: '{file['filename']}' that matches '{filename}'")
+        return file
+
+    def plan_upload(self, filepath: str, folder_path: Optional[str] = None,
+                    renamed_from: Optional[str] = None) -> 'SyncOperation':
+        """Decide how to bring one local file up to date in Canvas, without changing anything.
+
+        Files whose content hash matches the last upload are skipped. Changed files replace
+        their Canvas file in place, so module items keep pointing at it. A file renamed
+        locally (`renamed_from`) renames its Canvas file instead of uploading a new one.
         """
-        # Debug for Lecture 6
-        is_lecture6 = "Lecture6" in filename or "Lecture 6" in filename
-        if is_lecture6:
-            print(f"\n==== LOOKING FOR FILE: '{filename}' in '{folder_path}' ====")
-            print(f"Cache has {len(self._files_cache)} files")
-
-        # Check cache first for exact match
-        if filename in self._files_cache:
-            file = self._files_cache[filename]
-            # If folder path is specified, check if the file is in that folder
-            if folder_path and folder_path not in file.get('folder_path', ''):
-                if is_lecture6:
-                    print(f"Found exact filename match but wrong folder: {file.get('folder_path', '')}")
-                return None
-            if is_lecture6:
-                print(f"EXACT MATCH FOUND for '{filename}' in cache")
-            return file
-
-        # If not in cache, fetch all files in the folder
-        if is_lecture6:
-            print(f"No exact match in cache, fetching files from folder '{folder_path}'")
-        self.get_files_in_folder(folder_path)
-
-        # Check cache again for exact match
-        if filename in self._files_cache:
-            file = self._files_cache[filename]
-            # If folder path is specified, check if the file is in that folder
-            if folder_path and folder_path not in file.get('folder_path', ''):
-                if is_lecture6:
-                    print(f"Found exact filename match after fetch but wrong folder: {file.get('folder_path', '')}")
-                return None
-            if is_lecture6:
-                print(f"EXACT MATCH FOUND for '{filename}' after fetching")
-            return file
-
-        # For lecture materials, try to find similar files to prevent duplicates
-        if folder_path in ["lecture_slides", "lecture_notes"] and (filename.startswith("Lecture") or filename.startswith("Econ 2 Lecture")):
-            try:
-                # Extract lecture number
-                lecture_num = None
-                if filename.startswith("Lecture"):
-                    # For slides: "Lecture6_updated.pdf"
-                    lecture_num = int(''.join(filter(str.isdigit, filename.split('_')[0])))
-                    if is_lecture6:
-                        print(f"Extracted lecture number {lecture_num} from slides filename '{filename}'")
-                else:
-                    # For notes: "Econ 2 Lecture 6 S25.pdf"
-                    parts = filename.split()
-                    lecture_num = int(parts[parts.index("Lecture") + 1])
-                    if is_lecture6:
-                        print(f"Extracted lecture number {lecture_num} from notes filename '{filename}'")
-
-                # Look for files with the same lecture number
-                if is_lecture6:
-                    print(f"Looking for files with lecture number {lecture_num}")
-
-                for cached_filename, file in self._files_cache.items():
-                    if folder_path and folder_path not in file.get('folder_path', ''):
-                        if is_lecture6 and "Lecture" in cached_filename:
-                            print(f"Skipping '{cached_filename}' due to wrong folder: {file.get('folder_path', '')}")
-                        continue
-
-                    try:
-                        cached_lecture_num = None
-                        if cached_filename.startswith("Lecture"):
-                            cached_lecture_num = int(''.join(filter(str.isdigit, cached_filename.split('_')[0])))
-                            if is_lecture6 and cached_lecture_num == 6:
-                                print(f"Found slides with lecture number {cached_lecture_num}: '{cached_filename}'")
-                        elif cached_filename.startswith("Econ 2 Lecture"):
-                            cached_parts = cached_filename.split()
-                            cached_lecture_num = int(cached_parts[cached_parts.index("Lecture") + 1])
-                            if is_lecture6 and cached_lecture_num == 6:
-                                print(f"Found notes with lecture number {cached_lecture_num}: '{cached_filename}'")
-
-                        if cached_lecture_num == lecture_num:
-                            print(f"Found similar file: '{cached_filename}' that matches '{filename}'")
-                            if is_lecture6:
-                                print(f"SIMILAR MATCH FOUND: '{cached_filename}' for '{filename}'")
-                            return file
-                    except (ValueError, IndexError) as e:
-                        if is_lecture6 and "Lecture" in cached_filename:
-                            print(f"Error parsing '{cached_filename}': {str(e)}")
-                        continue
-            except (ValueError, IndexError) as e:
-                # If we can't parse the lecture number, fall back to exact match only
-                if is_lecture6:
-                    print(f"Error extracting lecture number from '{filename}': {str(e)}")
-                pass
-
-        if is_lecture6:
-            print(f"NO MATCH FOUND for '{filename}'")
-
-        return None
-
-    def upload_file(self, filepath: str, folder_path: Optional[str] = None) -> Dict:
-        """Upload a file to Canvas if it doesn't already exist."""
         filename = os.path.basename(filepath)
-        is_lecture6 = "Lecture6" in filename or "Lecture 6" in filename
 
-        if is_lecture6:
-            print(f"\n==== UPLOADING FILE: '{filename}' to '{folder_path}' ====")
-
-        # Check if file already exists
-        existing_file = self.get_file_by_name(filename, folder_path)
-        if existing_file:
-            print(f"File {filename} already exists in Canvas, using existing file.")
-            if is_lecture6:
-                print(f"Using existing file with ID: {existing_file.get('id')}")
-                print(f"Existing file details: {existing_file.get('filename')}, {existing_file.get('display_name')}")
-            return existing_file
-
-        # Special handling for Lecture 6 - double check by listing all files in the folder
-        if is_lecture6:
-            print("Double-checking for Lecture 6 files in Canvas...")
-            all_files = self.get_files_in_folder(folder_path)
-            print(f"Found {len(all_files)} files in folder '{folder_path}'")
-
-            # Look for any file that might be Lecture 6
-            for file in all_files:
-                file_name = file.get('filename', '')
-                if ("Lecture6" in file_name or "Lecture 6" in file_name) and folder_path in file.get('folder_path', ''):
-                    print(f"Found potential match for Lecture 6: {file_name}")
-                    print(f"Using existing file with ID: {file.get('id')}")
-                    return file
-
-            print("No existing Lecture 6 file found after thorough check, proceeding with upload")
-
-        # File doesn't exist, proceed with upload
+        with self._lock:
+            if renamed_from is not None:
+                self.hashes.rename(renamed_from, filepath)
+            with self.tracer.phase('hash', path=filepath):
+                digest = self.hashes.digest(filepath)
+            uploaded = self.hashes.uploaded(filepath)
+            known_file = self.state.files.get(str(uploaded['file_id'])) if uploaded else None
+            if renamed_from is not None and known_file is not None:
+                changed = uploaded['uploaded_sha256'] != digest
+                return SyncOperation('rename', path=filepath, folder=folder_path, file=known_file,
+                                     digest=digest, changed=changed,
+                                     detail=f"renamed from {renamed_from}" + (", content changed" if changed else ""))
+            if known_file is not None and uploaded['uploaded_sha256'] == digest:
+                return SyncOperation('skip', path=filepath, folder=folder_path, file=known_file,
+                                     digest=digest, detail="unchanged since last upload")
+
+            # Check if file already exists
+            existing_file = known_file or self.get_file_by_name(filename, folder_path)
+
+        if existing_file is None:
+            return SyncOperation('upload', path=filepath, folder=folder_path, digest=digest)
+
+        if known_file is None and self._holds_content(existing_file, filepath, digest):
+            # Never uploaded from this checkout, but Canvas already has exactly this content
+            return SyncOperation('skip', path=filepath, folder=folder_path, file=existing_file,
+                                 digest=digest, detail="already in Canvas", adopt=True)
+
+        return SyncOperation('replace', path=filepath, folder=folder_path, file=existing_file,
+                             digest=digest, detail=f"replaces Canvas file {existing_file['id']}")
+
+    def _holds_content(self, file: Dict[str, Any], filepath: str, digest: str) -> bool:
+        """Whether a Canvas file holds a local file's content, as is or optimized.
+
+        Only a Canvas file of the same size is downloaded and hashed. A file that cannot
+        be downloaded is taken to differ, so it is replaced rather than adopted.
+        """
+        candidates = {os.path.getsize(filepath): filepath}
+        artifact = self.pdf_optimizer.cached(digest) if self.pdf_optimizer is not None else None
+        if artifact is not None:
+            candidates.setdefault(artifact.stat().st_size, str(artifact))
+        source = candidates.get(file.get('size'))
+        if source is None:
+            return False
+        expected = digest if source == filepath else file_sha256(source)
+        try:
+            return self.remote_file_sha256(file) == expected
+        except requests.exceptions.RequestException as e:
+            print(f"Could not download {file['filename']} ({file['id']}) to compare it: {e}")
+            return False
+
+    def _optimized(self, op: 'SyncOperation') -> str:
+        """Return the file to upload for an operation, optimizing PDFs when enabled."""
+        if self.pdf_optimizer is None:
+            return op.path
+        with self.tracer.phase('optimize', path=op.path):
+            upload_path = self.pdf_optimizer.optimize(op.path, op.digest)
+        with self._lock:
+            self._pdf_savings.append((op.path, os.path.getsize(op.path), os.path.getsize(upload_path)))
+        return upload_path
+
+    def print_pdf_savings(self) -> None:
+        """Report the bytes PDF optimization saved on this sync's uploads."""
+        savings, self._pdf_savings = self._pdf_savings, []
+        if not savings:
+            return
+        print("\n==== PDF OPTIMIZATION ====")
+        for path, before, after in sorted(savings):
+            print(f"  {path}: {before / 1024:,.0f} KB -> {after / 1024:,.0f} KB "
+                  f"(saved {(before - after) / 1024:,.0f} KB)")
+        before = sum(s[1] for s in savings)
+        after = sum(s[2] for s in savings)
+        print(f"{len(savings)} files, saved {(before - after) / 1024:,.0f} KB of {before / 1024:,.0f} KB")
+
+    def apply_upload(self, op: 'SyncOperation') -> Dict:
+        """Carry out an upload, replace or skip operation and return the Canvas file."""
+        if op.action == 'skip':
+            if op.adopt:
+                with self._lock:
+                    self.hashes.record_upload(op.path, op.file['id'], op.digest)
+                self._journal_file(op.path, op.file, op.digest)
+            return op.file
+
+        with self.tracer.phase('upload', path=op.path, action=op.action,
+                               bytes=os.path.getsize(op.path)):
+            return self._transfer(op)
+
+    def _transfer(self, op: 'SyncOperation') -> Dict:
+        filename = os.path.basename(op.path)
         url = f"{self.base_url}/api/v1/courses/{self.course_id}/files"
 
-        data = {
-            'name': filename,
-            'parent_folder_path': folder_path,
-        }
+        data = {'name': filename}
+        if op.folder:
+            data['parent_folder_id'] = self.resolve_folder(op.folder)['id']
 
-        if is_lecture6:
-            print(f"Initiating upload request for '{filename}'")
+        existing_file = op.file if op.action in ('replace', 'rename') else None
+        if op.action == 'rename':
+            existing_file = self.rename_file(op.file, filename)
+            if not op.changed:
+                with self._lock:
+                    self.hashes.record_upload(op.path, existing_file['id'], op.digest)
+                self._journal_file(op.path, existing_file, op.digest)
+                return existing_file
 
-        response = requests.post(url, headers=self.headers, data=data)
-        response.raise_for_status()
-        upload_data = response.json()
+        if existing_file:
+            # Upload under the Canvas name so the overwrite replaces that file
+            print(f"File {filename} changed, replacing Canvas file {existing_file.get('id')}.")
+            data['name'] = existing_file.get('display_name') or existing_file['filename']
+            data['on_duplicate'] = 'overwrite'
+
+        source = self.relay_from.wait(op.path, op.digest) if self.relay_from is not None else None
+        if source is not None and data.get('parent_folder_id') and \
+                (source.get('display_name') or source['filename']) == data['name']:
+            file_data = self.copy_file(source, data['parent_folder_id'],
+                                       overwrite=existing_file is not None)
+        else:
+            upload_path = self._optimized(op)
+            data['size'] = os.path.getsize(upload_path)
+            response = self.http.post(url, data=data)
+            response.raise_for_status()
+            upload_data = response.json()
+            file_data = self._send_file_bytes(upload_data, upload_path, data['name'])
+
+        replaced = None
+        with self._lock:
+            if existing_file and str(existing_file['id']) != str(file_data['id']):
+                replaced = existing_file['id']
+                self.state.forget_file(replaced)
+                self._file_index.remove(replaced)
+            file_data = self._remember_file(file_data)
+            self.hashes.record_upload(op.path, file_data['id'], op.digest)
+        self._journal_file(op.path, file_data, op.digest, replaced)
+
+        print(f"Uploaded {filename} (file ID {file_data.get('id')})")
+        return file_data
 
-        if is_lecture6:
-            print(f"Got upload URL, sending file content")
+    def copy_file(self, source: Dict[str, Any], folder_id: Any, overwrite: bool = False) -> Dict:
+        """Copy a Canvas file (from any course) into a folder of this course, server-side."""
+        url = f"{self.base_url}/api/v1/folders/{folder_id}/copy_file"
+        data = {'source_file_id': source['id'], 'on_duplicate': 'overwrite' if overwrite else 'rename'}
+        response = self.http.post(url, data=data)
+        response.raise_for_status()
+        print(f"Copied Canvas file {source['id']} into course {self.course_id}")
+        return response.json()
 
-        with open(filepath, 'rb') as file:
-            files = {'file': file}
-            response = requests.post(upload_data['upload_url'], data=upload_data['upload_params'], files=files)
-            response.raise_for_status()
+    def rename_file(self, file: Dict[str, Any], name: str) -> Dict:
+        """Rename a Canvas file in place, keeping its ID and module items."""
+        url = f"{self.base_url}/api/v1/files/{file['id']}"
+        response = self.http.put(url, data={'name': name, 'on_duplicate': 'rename'})
+        response.raise_for_status()
+        print(f"Renamed Canvas file {file['id']} to {name}")
+        with self._lock:
+            return self._remember_file(response.json())
 
-        # Add to cache
-        file_data = response.json()
-        self._files_cache[filename] = file_data
+    def upload_file(self, filepath: str, folder_path: Optional[str] = None) -> Dict:
+        """Upload a file to Canvas unless the same content is already there."""
+        return self.apply_upload(self.plan_upload(filepath, folder_path))
 
-        if is_lecture6:
-            print(f"Successfully uploaded '{filename}' with ID: {file_data.get('id')}")
+    def _send_file_bytes(self, upload_data: Dict[str, Any], filepath: str, filename: str) -> Dict:
+        """Stream a file to the `upload_url` from an initiated upload and return the Canvas file.
 
-        return file_data
+        The upload URL stays valid after a failed transfer, so only the byte transfer is
+        retried; the upload is not initiated again.
+        """
+        def report(sent: int, total: int) -> None:
+            if self.upload_progress is not None:
+                self.upload_progress(filename, sent, total)
+
+        with MultipartFileStream(upload_data['upload_params'], filepath, filename, progress=report) as body:
+            headers = {'Content-Type': body.content_type}
+            attempt = 0
+            while True:
+                body.seek(0)
+                try:
+                    response = self.http.post(upload_data['upload_url'], auth=False, data=body, headers=headers)
+                    if response.status_code < 500:
+                        response.raise_for_status()
+                        return response.json()
+                    error = f"status {response.status_code}"
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error = str(e)
+
+                if attempt >= self.upload_retries:
+                    raise requests.exceptions.RetryError(f"Upload of {filename} failed: {error}")
+                delay = self.http._backoff(attempt)
+                attempt += 1
+                print(f"Upload of {filename} failed ({error}), resending bytes in {delay:.1f}s")
+                time.sleep(delay)
 
     def get_module_items(self, module_id: str) -> List:
-        """Get all items in a module."""
+        """Get all items in a module, from the state manifest when it is known."""
+        if str(module_id) in self.state.module_items:
+            return self.state.module_items[str(module_id)]
+        return self.state.set_module_items(module_id, self._fetch_module_items(module_id))
+
+    def _fetch_module_items(self, module_id: str) -> List:
         url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules/{module_id}/items"
-        params = {'per_page': 100}  # Get more items per page
+        return list(self.http.paginate(url, {'per_page': 100}))
 
-        all_items = []
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        items = response.json()
-        all_items.extend(items)
+    def module_item_index(self, module_id: str) -> 'ModuleItemIndex':
+        """Return the item index for a module, building it from the known items once."""
+        index = self._item_indexes.get(str(module_id))
+        if index is None:
+            index = ModuleItemIndex(self.get_module_items(module_id))
+            self._item_indexes[str(module_id)] = index
+        return index
 
-        # Handle pagination if needed
-        while 'next' in response.links:
-            response = requests.get(response.links['next']['url'], headers=self.headers)
-            response.raise_for_status()
-            items = response.json()
-            all_items.extend(items)
-
-        return all_items
+    def invalidate_module_items(self, module_id: str) -> None:
+        """Drop what we know about a module's items so the next lookup re-lists them."""
+        self._item_indexes.pop(str(module_id), None)
+        self.state.module_items.pop(str(module_id), None)
 
     def item_exists_in_module(self, module_id: str, title: str) -> bool:
         """Check if an item with the given title already exists in the module.
 
-        For lecture materials, also checks for similar titles to prevent duplicates.
+        For lecture materials, also matches other titles for the same lecture and material
+        type to prevent duplicates.
         """
-        items = self.get_module_items(module_id)
-
-        # Debug for Lecture 6
-        if "Lecture 6" in title:
-            print(f"\n==== CHECKING IF ITEM EXISTS: '{title}' ====")
-            print(f"Module ID: {module_id}")
-            print(f"Found {len(items)} items in module")
-            for item in items:
-                print(f"  - Item: '{item['title']}'")
-
-        # Exact title match
-        if any(item['title'] == title for item in items):
-            if "Lecture 6" in title:
-                print(f"EXACT MATCH FOUND for '{title}'")
-            return True
-
-        # For lecture materials, do additional checks to prevent duplicates
-        if title.startswith("Lecture ") and (" - Slides" in title or " - Notes" in title):
-            # Extract lecture number
-            try:
-                lecture_num = int(title.split("Lecture ")[1].split(" -")[0])
-                material_type = "Slides" if "- Slides" in title else "Notes"
-
-                # Check for any item with the same lecture number and material type
-                for item in items:
-                    item_title = item['title']
-                    if item_title.startswith(f"Lecture {lecture_num}") and f"- {material_type}" in item_title:
-                        print(f"Found similar item: '{item_title}' that matches '{title}'")
-                        if "Lecture 6" in title:
-                            print(f"SIMILAR MATCH FOUND for '{title}' -> '{item_title}'")
-                        return True
-            except (ValueError, IndexError):
-                # If we can't parse the lecture number, fall back to exact match only
-                if "Lecture 6" in title:
-                    print(f"ERROR parsing lecture number for '{title}'")
-                pass
-
-        if "Lecture 6" in title:
-            print(f"NO MATCH FOUND for '{title}'")
-
-        return False
+        match = self.module_item_index(module_id).find(title)
+        if match is not None and match['title'] != title:
+            print(f"Found similar item: '{match['title']}' that matches '{title}'")
+        return match is not None
 
     def create_module_item(self, module_id: str, title: str, file_id: Optional[str] = None,
                          external_url: Optional[str] = None, position: Optional[int] = None) -> Dict:
         """Create a module item in Canvas if it doesn't already exist."""
-        is_lecture6 = "Lecture 6" in title
-        if is_lecture6:
-            print(f"\n==== CREATING MODULE ITEM: '{title}' ====")
-            print(f"Module ID: {module_id}")
-            print(f"File ID: {file_id}")
-            print(f"Position: {position}")
-
         # Check if item already exists
-        if self.item_exists_in_module(module_id, title):
+        index = self.module_item_index(module_id)
+        existing_item = index.find(title)
+        if existing_item is not None:
             print(f"Module item '{title}' already exists, skipping creation.")
-            # Return a dummy dict to maintain compatibility
-            return {"id": "existing", "title": title}
-
-        if is_lecture6:
-            print(f"No existing item found, creating new module item for '{title}'")
+            return existing_item
 
         url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules/{module_id}/items"
 
@@ -349,18 +2125,32 @@ class CanvasIntegrator:
         if position is not None:
             data['module_item[position]'] = position
 
-        if is_lecture6:
-            print(f"Sending request with data: {data}")
-
-        response = requests.post(url, headers=self.headers, data=data)
-        response.raise_for_status()
-        result = response.json()
-
-        if is_lecture6:
-            print(f"Created module item with ID: {result.get('id')}")
+        with self.tracer.phase('create_item', title=title, module_id=str(module_id)):
+            response = self.http.post(url, data=data)
+            if response.status_code == 409:
+                # Our index disagrees with Canvas; re-list the module and check again
+                print(f"Conflict creating module item '{title}', refreshing module items")
+                self.invalidate_module_items(module_id)
+                existing_item = self.module_item_index(module_id).find(title)
+                if existing_item is not None:
+                    return existing_item
+            response.raise_for_status()
+            result = response.json()
 
+        self.journal.append('item', module_id=str(module_id), item=result)
+        self.state.record_module_item(module_id, result)
+        index.add(result)
         return result
 
+    def delete_module_item(self, module_id: str, item_id: str) -> None:
+        """Delete a single module item."""
+        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules/{module_id}/items/{item_id}"
+        response = self.http.delete(url)
+        response.raise_for_status()
+        self.journal.append('delete_item', module_id=str(module_id), item_id=item_id)
+        self.state.forget_module_item(module_id, item_id)
+        self.module_item_index(module_id).remove(item_id)
+
     def delete_module(self, module_id: str, module_name: str) -> None:
         """Delete a module from Canvas if it's one we manage."""
         # List of modules we manage automatically
@@ -369,100 +2159,205 @@ class CanvasIntegrator:
         if module_name in managed_modules:
             print(f"Deleting module: {module_name}...")
             url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules/{module_id}"
-            response = requests.delete(url, headers=self.headers)
+            response = self.http.delete(url)
             response.raise_for_status()
+            self.journal.append('delete_module', module_id=str(module_id))
+            self.state.forget_module(module_id)
+            self._item_indexes.pop(str(module_id), None)
+            self._modules.pop(module_name, None)
         else:
             print(f"Skipping deletion of manually managed module: {module_name}")
 
     def delete_managed_modules(self) -> None:
         """Delete only the modules that we manage automatically."""
-        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
+        if self._modules_reconciled:
+            modules = list(self.state.modules.values())
+        else:
+            url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules"
+            modules = list(self.http.paginate(url, {'per_page': 100}))
 
-        for module in response.json():
+        for module in modules:
             self.delete_module(module['id'], module['name'])
 
-    def sync_materials(self):
-        """Sync all course materials to Canvas."""
-        print("Starting Canvas sync...")
-
-        # Pre-load existing files to avoid duplicate uploads
-        print("Loading existing files from Canvas...")
-        self.get_files_in_folder("lecture_slides")
-        self.get_files_in_folder("lecture_notes")
-        self.get_files_in_folder("course_materials")
-        # NOTE: review_session syncing disabled
-
-        # Get existing modules instead of deleting them
-        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        existing_modules = {module['name']: module for module in response.json()}
-
-        # Course Information Module (position 1, manually managed)
-        course_info = existing_modules.get("Course Information") or self.get_or_create_module("Course Information", position=1)
-        print("Found/Created Course Information module")
-
-        # Upload syllabus if it exists
-        syllabus_path = Path("course_materials") / self.syllabus_filename
-        if syllabus_path.exists():
+    def delete_file(self, file: Dict[str, Any]) -> None:
+        """Delete a Canvas file and forget it."""
+        url = f"{self.base_url}/api/v1/files/{file['id']}"
+        response = self.http.delete(url)
+        if response.status_code != 404:  # Already gone is as good as deleted
+            response.raise_for_status()
+        self.journal.append('delete_file', file_id=file['id'])
+        with self._lock:
+            self.state.forget_file(file['id'])
+            self._file_index.remove(file['id'])
+
+    def plan_compaction(self) -> List[Dict[str, Any]]:
+        """Find lecture materials with several identical copies in the managed Canvas folders.
+
+        Copies are grouped by (folder, kind, lecture number), the same key the sync uses to
+        match a local file to a Canvas file. Each group keeps one canonical copy: the one
+        module items link to, else the one last uploaded from this checkout, else the
+        newest. Another copy only counts as a duplicate once its content is proven equal to
+        the canonical copy's: same size, then same sha256. Returns one entry per group with
+        the canonical file, the duplicates, the copies whose content differs (which are
+        kept) and the module items that link to a duplicate.
+        """
+        linked: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        for module_id, items in self.state.module_items.items():
+            for item in items:
+                if item.get('type') == 'File' and item.get('content_id') is not None:
+                    linked.setdefault(str(item['content_id']), []).append((module_id, item))
+        uploaded = {str(entry['file_id']): entry.get('uploaded_sha256')
+                    for entry in self.hashes.entries.values() if entry.get('file_id') is not None}
+
+        def rank(file: Dict[str, Any]) -> Tuple:
+            file_id = str(file['id'])
+            return (file_id in linked, file_id in uploaded, file.get('updated_at') or '', int(file['id']))
+
+        groups = []
+        for key, files in sorted(self._file_index.by_lecture.items()):
+            if len(files) < 2:
+                continue
+            canonical = max(files, key=rank)
+            groups.append({
+                'key': key,
+                'canonical': canonical,
+                'copies': [file for file in files if file is not canonical],
+            })
+
+        # Only copies the same size as their canonical copy can be identical, so only those
+        # (and the canonical copies) are hashed
+        def digest(file: Dict[str, Any]) -> Optional[str]:
             try:
-                print(f"Uploading syllabus: {syllabus_path}...")
-                file_data = self.upload_file(str(syllabus_path), "course_materials")
-                # Only create the item if it doesn't already exist
-                if not self.item_exists_in_module(course_info['id'], "Course Syllabus"):
-                    self.create_module_item(
-                        course_info['id'],
-                        "Course Syllabus",
-                        file_id=file_data['id'],
-                        position=1
-                    )
-            except Exception as e:
-                print(f"Error uploading syllabus: {e}")
+                return uploaded.get(str(file['id'])) or self.remote_file_sha256(file)
+            except requests.exceptions.RequestException as e:
+                print(f"Could not download {file['filename']} ({file['id']}): {e}")
+                return None
 
-        # Lecture Materials Module (position 2)
-        lecture_materials = existing_modules.get("Lecture Materials") or self.get_or_create_module("Lecture Materials", position=2)
-        print("Found/Created Lecture Materials module")
+        to_hash = {}
+        for group in groups:
+            size = group['canonical'].get('size')
+            same_size = [file for file in group['copies'] if size is not None and file.get('size') == size]
+            if same_size:
+                for file in [group['canonical']] + same_size:
+                    to_hash[str(file['id'])] = file
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            digests = dict(zip(to_hash, pool.map(digest, to_hash.values())))
+
+        for group in groups:
+            expected = digests.get(str(group['canonical']['id']))
+            copies = group.pop('copies')
+            group['duplicates'] = [file for file in copies
+                                   if expected is not None and digests.get(str(file['id'])) == expected]
+            group['different'] = [file for file in copies if file not in group['duplicates']]
+            group['items'] = [(module_id, item) for file in group['duplicates']
+                              for module_id, item in linked.get(str(file['id']), [])]
+        return groups
+
+    def remote_file_sha256(self, file: Dict[str, Any], chunk_size: int = 1 << 20) -> str:
+        """Return the sha256 of a Canvas file's content, downloading it in chunks."""
+        response = self.http.get(f"{self.base_url}/api/v1/files/{file['id']}")
+        response.raise_for_status()
+        # The download URL is pre-signed, so it goes out without the Canvas token
+        download = self.http.get(response.json()['url'], auth=False, stream=True)
+        download.raise_for_status()
+        digest = hashlib.sha256()
+        for chunk in download.iter_content(chunk_size):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def compact_duplicates(self, dry_run: bool = False) -> int:
+        """Delete identical copies of lecture materials, keeping one copy of each.
+
+        Copies whose content differs from the canonical copy are never touched. Module
+        items linking to a duplicate are pointed at the canonical copy first (Canvas
+        cannot change an item's file, so the item is recreated in place), then the
+        duplicates are deleted in parallel. Returns the number of failed operations.
+        """
+        with self.tracer.phase('list'):
+            self.refresh_state(full=self.full_refresh)
+        groups = self.plan_compaction()
+
+        print("\n==== DUPLICATE COMPACTION ====")
+        for group in groups:
+            folder, kind, lecture_num = group['key']
+            canonical = group['canonical']
+            print(f"  {folder} Lecture {lecture_num} {kind}: keep {canonical['filename']} ({canonical['id']})")
+            for file in group['duplicates']:
+                print(f"    delete {file['filename']} ({file['id']}, identical content)")
+            for file in group['different']:
+                print(f"    keep {file['filename']} ({file['id']}, different content)")
+            for module_id, item in group['items']:
+                print(f"    relink module item '{item['title']}' in module {module_id}")
+        duplicates = [file for group in groups for file in group['duplicates']]
+        freed = sum(file.get('size') or 0 for file in duplicates)
+        print(f"{len(duplicates)} duplicate files in {len(groups)} groups, {freed / 1024:,.0f} KB")
+        if dry_run or not duplicates:
+            if dry_run:
+                print("Dry run: no changes made.")
+            return 0
+
+        failures = 0
+        try:
+            for group in groups:
+                for module_id, item in group['items']:
+                    try:
+                        self._relink_module_item(module_id, item, group['canonical'])
+                    except requests.exceptions.RequestException as e:
+                        failures += 1
+                        print(f"Error relinking module item '{item['title']}': {e}")
+                        # Never delete a file a module item may still link to
+                        group['duplicates'] = [file for file in group['duplicates']
+                                               if str(file['id']) != str(item['content_id'])]
+
+            doomed = [file for group in groups for file in group['duplicates']]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(self.delete_file, file): file for file in doomed}
+            for future, file in futures.items():
+                try:
+                    future.result()
+                except requests.exceptions.RequestException as e:
+                    failures += 1
+                    print(f"Error deleting {file['filename']} ({file['id']}): {e}")
+
+            # Local files last uploaded as a deleted copy are matched afresh next sync
+            deleted = {str(file['id']) for file in doomed} - set(self.state.files)
+            for path, entry in list(self.hashes.entries.items()):
+                if str(entry.get('file_id')) in deleted:
+                    self.hashes.forget(path)
+            print(f"Deleted {len(deleted)} duplicate files, {failures} failures")
+        finally:
+            self.state.save()
+            self.hashes.save()
+            self.journal.clear()
+        return failures
+
+    def _relink_module_item(self, module_id: str, item: Dict[str, Any], file: Dict[str, Any]) -> None:
+        """Point a module item at another file, keeping its title and position."""
+        if any(str(other.get('content_id')) == str(file['id'])
+               for other in self.state.module_items.get(str(module_id), [])):
+            # The module already links to the canonical copy; the stray item just goes
+            self.delete_module_item(module_id, item['id'])
+            return
+        self.delete_module_item(module_id, item['id'])
+        self.create_module_item(module_id, item['title'], file_id=file['id'], position=item.get('position'))
+
+    def move_module_item(self, module_id: str, item_id: str, position: int) -> Dict:
+        """Move a module item to a new position within its module."""
+        url = f"{self.base_url}/api/v1/courses/{self.course_id}/modules/{module_id}/items/{item_id}"
+        response = self.http.put(url, data={'module_item[position]': position})
+        response.raise_for_status()
+        self.journal.append('move', module_id=str(module_id), item_id=item_id, position=position)
+        self.state.move_module_item(module_id, item_id, position)
+        return response.json()
 
-        # NOTE: Discussion Activities + Review Sessions syncing disabled
+    def _collect_lecture_materials(self) -> List[Dict[str, Any]]:
+        """Find local lecture slides and notes, one file per lecture number and material type."""
+        lecture_materials = []
 
         # Track processed lecture numbers to prevent duplicates
         processed_lecture_slides = set()
         processed_lecture_notes = set()
 
-        # Get all existing module items to check for duplicates
-        lecture_materials_items = self.get_module_items(lecture_materials['id'])
-        print(f"\n==== CHECKING EXISTING MODULE ITEMS ====")
-        print(f"Found {len(lecture_materials_items)} items in Lecture Materials module")
-
-        # Track which lecture materials already exist in Canvas
-        lecture_slides_in_canvas = set()
-        lecture_notes_in_canvas = set()
-
-        for item in lecture_materials_items:
-            if " - Slides" in item['title'] and item['title'].startswith("Lecture "):
-                try:
-                    lecture_num = int(item['title'].split("Lecture ")[1].split(" -")[0])
-                    lecture_slides_in_canvas.add(lecture_num)
-                    print(f"Found existing slides for Lecture {lecture_num}")
-                except (ValueError, IndexError):
-                    pass
-            elif " - Notes" in item['title'] and item['title'].startswith("Lecture "):
-                try:
-                    lecture_num = int(item['title'].split("Lecture ")[1].split(" -")[0])
-                    lecture_notes_in_canvas.add(lecture_num)
-                    print(f"Found existing notes for Lecture {lecture_num}")
-                except (ValueError, IndexError):
-                    pass
-
-        # Add existing lectures to processed sets to prevent duplicates
-        processed_lecture_slides.update(lecture_slides_in_canvas)
-        processed_lecture_notes.update(lecture_notes_in_canvas)
-
-        print(f"Lectures with slides already in Canvas: {sorted(lecture_slides_in_canvas)}")
-        print(f"Lectures with notes already in Canvas: {sorted(lecture_notes_in_canvas)}")
-
         # Upload and organize lecture slides
         slides_dir = Path("lecture_slides")
         if slides_dir.exists():
@@ -471,51 +2366,23 @@ class CanvasIntegrator:
 
             for slide in sorted(slides_dir.glob("*.pdf")):
                 try:
-                    is_lecture6 = "Lecture6" in slide.name
-                    print(f"\nProcessing {slide.name}...")
                     # Extract lecture number from "Lecture1_updated.pdf" format
-                    lecture_num = int(''.join(filter(str.isdigit, slide.stem.split('_')[0])))
-
-                    if is_lecture6:
-                        print(f"LECTURE 6 SLIDES DETECTED: {slide.name}")
-                        print(f"Extracted lecture number: {lecture_num}")
-                        print(f"Already processed slides: {processed_lecture_slides}")
-
-                    # Special handling for Lecture 6 - check if it's already in our processed set
-                    if lecture_num == 6:
-                        if 6 in lecture_slides_in_canvas:
-                            print(f"SPECIAL HANDLING: Skipping Lecture 6 slides as they already exist in Canvas")
-                            continue
-                        else:
-                            print(f"SPECIAL HANDLING: Adding Lecture 6 slides as they don't exist in Canvas")
+                    lecture_num = parse_lecture_number(slide.name)
+                    if lecture_num is None:
+                        raise ValueError("Could not parse lecture number from filename")
 
                     # Skip if we've already processed this lecture number
                     if lecture_num in processed_lecture_slides:
                         print(f"Skipping duplicate slide for Lecture {lecture_num}")
                         continue
 
-                    if is_lecture6:
-                        print(f"Proceeding with upload for Lecture 6 slides")
-
-                    file_data = self.upload_file(str(slide), "lecture_slides")
-                    item_title = f"Lecture {lecture_num} - Slides"
-
-                    if is_lecture6:
-                        print(f"Creating module item with title: '{item_title}'")
-                        print(f"File data ID: {file_data['id']}")
-
-                    self.create_module_item(
-                        lecture_materials['id'],
-                        item_title,
-                        file_id=file_data['id'],
-                        position=lecture_num * 2 - 1  # Odd positions for slides
-                    )
-
                     # Mark this lecture number as processed
                     processed_lecture_slides.add(lecture_num)
-                    if is_lecture6:
-                        print(f"Added lecture number {lecture_num} to processed_lecture_slides")
-                        print(f"Updated processed slides: {processed_lecture_slides}")
+                    lecture_materials.append({
+                        'path': str(slide),
+                        'folder': "lecture_slides",
+                        'title': f"Lecture {lecture_num} - Slides",
+                    })
                 except Exception as e:
                     print(f"Error processing {slide.name}: {e}")
 
@@ -524,72 +2391,354 @@ class CanvasIntegrator:
         if notes_dir.exists():
             for note in sorted(notes_dir.glob("*.pdf")):
                 try:
-                    print(f"Processing {note.name}...")
-
-                    stem = note.stem
-
-                    # Support multiple filename formats:
-                    # - "Econ 2 Lecture 1 W26.pdf"
-                    # - "Lecture1notes_updated.pdf" / "Lecture1_notes.pdf"
-                    lecture_num = None
-
-                    parts = stem.split()
-                    if "Lecture" in parts:
-                        lecture_num = int(parts[parts.index("Lecture") + 1])
-                    else:
-                        # Fallback: extract digits from first token that starts with "Lecture"
-                        tokens = stem.replace('_', ' ').split()
-                        lecture_token = next((t for t in tokens if t.lower().startswith('lecture')), None)
-                        if lecture_token:
-                            digits = ''.join(ch for ch in lecture_token if ch.isdigit())
-                            if digits:
-                                lecture_num = int(digits)
-
+                    # Supports "Econ 2 Lecture 1 W26.pdf", "Lecture1notes_updated.pdf"
+                    # and "Lecture1_notes.pdf"
+                    lecture_num = parse_lecture_number(note.name)
                     if lecture_num is None:
                         raise ValueError("Could not parse lecture number from filename")
 
-                    is_lecture6 = lecture_num == 6
-                    if is_lecture6:
-                        print(f"LECTURE 6 NOTES DETECTED: {note.name}")
-                        print(f"Extracted lecture number: {lecture_num}")
-                        print(f"Already processed notes: {processed_lecture_notes}")
-
-                    # Special handling for Lecture 6 - check if it's already in our processed set
-                    if lecture_num == 6:
-                        if 6 in lecture_notes_in_canvas:
-                            print(f"SPECIAL HANDLING: Skipping Lecture 6 notes as they already exist in Canvas")
-                            continue
-                        else:
-                            print(f"SPECIAL HANDLING: Adding Lecture 6 notes as they don't exist in Canvas")
-
                     # Skip if we've already processed this lecture number
                     if lecture_num in processed_lecture_notes:
                         print(f"Skipping duplicate note for Lecture {lecture_num}")
                         continue
 
-                    file_data = self.upload_file(str(note), "lecture_notes")
-                    item_title = f"Lecture {lecture_num} - Notes"
-
-                    self.create_module_item(
-                        lecture_materials['id'],
-                        item_title,
-                        file_id=file_data['id'],
-                        position=lecture_num * 2  # Even positions for notes
-                    )
-
                     # Mark this lecture number as processed
                     processed_lecture_notes.add(lecture_num)
+                    lecture_materials.append({
+                        'path': str(note),
+                        'folder': "lecture_notes",
+                        'title': f"Lecture {lecture_num} - Notes",
+                    })
                 except Exception as e:
                     print(f"Error processing {note.name}: {e}")
 
-        # Upload and organize activities (excluding node_modules)
-        # NOTE: Discussion Activities syncing disabled
+        return lecture_materials
+
+    def _plan_module_items(self, plan: 'SyncPlan', module_name: str, module_position: int,
+                           entries: List[Dict[str, Any]], arrange: bool = False) -> None:
+        """Plan the items of one module.
+
+        Missing items are created. With `arrange`, lecture items (new and existing) are also
+        laid out in lecture order, slides before notes, ahead of any other items. Moves are
+        worked out against a simulated copy of the module so the executor can replay them
+        in order.
+        """
+        module = next((m for m in self.state.modules.values() if m['name'] == module_name), None)
+        if module is None:
+            plan.add(SyncOperation('create_module', module=module_name, position=module_position))
+            index = ModuleItemIndex([])
+            existing: List[Dict[str, Any]] = []
+        else:
+            index = self.module_item_index(module['id'])
+            existing = self.get_module_items(module['id'])
+        order: List[Any] = [item['id'] for item in existing]
+
+        if not arrange:
+            for entry in entries:
+                if index.find(entry['title']) is None:
+                    plan.add(SyncOperation('create_item', module=module_name, title=entry['title'],
+                                           path=entry['path'], position=entry['position']))
+            return
+
+        by_key = {ModuleItemIndex.lecture_key(entry['title']): entry for entry in entries}
+        keys = sorted(set(by_key) | set(index.by_lecture),
+                      key=lambda key: (key[0], 0 if key[1] == "Slides" else 1))
+
+        # New items are appended without a position, so Canvas never shifts the items after
+        # them; the layout is then fixed with the fewest moves. Items are identified by ID,
+        # or by title until they exist. Any existing item may need moving, not only lecture
+        # items: non-lecture items and repeated lecture titles are shifted after the lectures.
+        items: Dict[Any, Tuple[str, Optional[Dict[str, Any]]]] = {
+            item['id']: (item['title'], item) for item in existing
+        }
+        lecture_order = []
+        for key in keys:
+            item = index.by_lecture.get(key)
+            if item is None:
+                entry = by_key[key]
+                plan.add(SyncOperation('create_item', module=module_name, title=entry['title'],
+                                       path=entry['path']))
+                order.append(entry['title'])
+                items[entry['title']] = (entry['title'], None)
+                lecture_order.append(entry['title'])
+            else:
+                lecture_order.append(item['id'])
+
+        # Lecture items go first; anything else keeps its relative order after them
+        lecture_handles = set(lecture_order)
+        desired = lecture_order + [handle for handle in order if handle not in lecture_handles]
+        for handle, position in minimal_moves(order, desired):
+            title, item = items[handle]
+            plan.add(SyncOperation('move_item', module=module_name, title=title, item=item,
+                                   position=position))
+
+    def plan_sync(self, changes: Optional[ChangeSet] = None) -> 'SyncPlan':
+        """Diff local course materials against Canvas and return the operations to apply.
+
+        With `changes`, only paths added, modified or renamed since its base commit are
+        considered.
+        """
+        # Pre-load existing files and modules to avoid duplicate uploads
+        print("Loading existing files from Canvas...")
+        with self.tracer.phase('list'):
+            self.refresh_state(full=self.full_refresh)
+        # NOTE: review_session syncing disabled
+
+        plan = SyncPlan()
+
+        def wanted(path: str) -> bool:
+            return changes is None or changes.touches(path)
+
+        def renamed_from(path: str) -> Optional[str]:
+            return changes.renamed.get(Path(path).as_posix()) if changes is not None else None
+
+        if changes is not None:
+            print(f"Incremental sync: {len(changes)} changed paths since {changes.base[:12]}")
+            for path in sorted(changes.deleted):
+                # Deleting from Canvas is left to a human; just stop tracking the file
+                print(f"{path} was deleted locally, leaving it in Canvas")
+                self.hashes.forget(path)
+
+        # Course Information Module (position 1, manually managed)
+        syllabus_entries = []
+        syllabus_path = Path("course_materials") / self.syllabus_filename
+        if syllabus_path.exists() and wanted(str(syllabus_path)):
+            plan.add(self.plan_upload(str(syllabus_path), "course_materials", renamed_from(str(syllabus_path))))
+            syllabus_entries.append({'path': str(syllabus_path), 'title': "Course Syllabus", 'position': 1})
+        self._plan_module_items(plan, "Course Information", 1, syllabus_entries)
+
+        # Lecture Materials Module (position 2)
+        lecture_entries = [entry for entry in self._collect_lecture_materials() if wanted(entry['path'])]
+        for entry in lecture_entries:
+            plan.add(self.plan_upload(entry['path'], entry['folder'], renamed_from(entry['path'])))
+        self._plan_module_items(plan, "Lecture Materials", 2, lecture_entries, arrange=True)
+
+        # NOTE: Discussion Activities + Review Sessions syncing disabled
+        return plan
+
+    def apply_plan(self, plan: 'SyncPlan') -> int:
+        """Apply a sync plan and return the number of operations that failed.
 
-        # Upload and organize review sessions
-        # NOTE: Review Sessions syncing disabled
+        Uploads run concurrently on the worker pool. Module operations are applied in plan
+        order, each waiting only for the upload it links to.
+        """
+        failures = 0
+        if self.relay_to is not None:
+            self.relay_to.expect(op.path for op in plan.file_operations())
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            uploads = {op.path: pool.submit(self._apply_and_relay, op) for op in plan.file_operations()}
 
+            for op in plan.module_operations():
+                try:
+                    if op.action == 'create_module':
+                        self.get_or_create_module(op.module, position=op.position)
+                        print(f"Created {op.module} module")
+                        continue
+
+                    module_id = self.get_or_create_module(op.module)['id']
+                    if op.action == 'create_item':
+                        file_data = uploads[op.path].result()
+                        self.create_module_item(module_id, op.title, file_id=file_data['id'],
+                                                position=op.position)
+                    elif op.action == 'move_item':
+                        # Items created earlier in this plan are looked up by title
+                        item = op.item or self.module_item_index(module_id).find(op.title)
+                        self.move_module_item(module_id, item['id'], op.position)
+                except Exception as e:
+                    failures += 1
+                    print(f"Error applying {op.describe()}: {e}")
+
+            for path, future in uploads.items():
+                if future.exception() is not None:
+                    failures += 1
+                    print(f"Error uploading {path}: {future.exception()}")
+        return failures
+
+    def _apply_and_relay(self, op: 'SyncOperation') -> Dict:
+        file_data = None
+        try:
+            file_data = self.apply_upload(op)
+            return file_data
+        finally:
+            if self.relay_to is not None:
+                self.relay_to.publish(op.path, file_data, op.digest)
+
+    def sync_materials(self, dry_run: bool = False, since: Optional[str] = None,
+                       incremental: bool = False, changes: Optional[ChangeSet] = None) -> 'SyncPlan':
+        """Sync all course materials to Canvas.
+
+        With `dry_run` the plan is printed and nothing is changed in Canvas or on disk.
+        `since` limits the sync to files changed since that git commit; `incremental` does
+        the same from the commit of the last successful sync. `changes` limits it to an
+        explicit change set, e.g. from the file watcher.
+        """
+        print("Starting Canvas sync...")
+        base = since or (self.state.synced_commit if incremental else None)
+        if changes is None and base:
+            changes = ChangeSet.from_git(base)
+            if changes is None:
+                print(f"Cannot diff against commit {base}, syncing everything")
+        elif changes is None and incremental:
+            print("No previous sync commit recorded, syncing everything")
+
+        head = git_head()
+        try:
+            with self.tracer.phase('plan'):
+                plan = self.plan_sync(changes)
+            plan.print()
+            if dry_run:
+                print("Dry run: no changes made.")
+                return plan
+            with self.tracer.phase('apply'):
+                failures = self.apply_plan(plan)
+            if any(op.action != 'skip' for op in plan.file_operations()):
+                self._catch_up_files()
+            self.print_pdf_savings()
+            if failures == 0 and head:
+                self.state.synced_commit = head
+            return plan
+        finally:
+            if self.relay_to is not None:
+                self.relay_to.close()
+            if not dry_run:
+                self.state.save()
+                self.hashes.save()
+                # Everything journaled is now in the manifest
+                self.journal.clear()
+
+
+class CourseFanout:
+    """Sync the same materials to several Canvas courses in one run.
+
+    Every course is planned and applied concurrently over one shared transport, so the
+    connection pool, rate-limit scheduler and trace are shared. Files are uploaded to the
+    first course only; the others copy them server-side as soon as each upload finishes,
+    falling back to a normal upload when there is nothing to copy.
+    """
+
+    def __init__(self, integrators: List[CanvasIntegrator]):
+        if not integrators:
+            raise ValueError("CourseFanout needs at least one course")
+        self.integrators = integrators
+
+    def sync_materials(self, dry_run: bool = False, since: Optional[str] = None,
+                       incremental: bool = False, changes: Optional[ChangeSet] = None) -> Dict[str, 'SyncPlan']:
+        """Sync every course and return each course's plan by course ID."""
+        # A relay only lives for one sync: once closed it hands out nothing new
+        relay = FileRelay()
+        self.integrators[0].relay_to = relay
+        for integrator in self.integrators[1:]:
+            integrator.relay_from = relay
+
+        def sync(integrator: CanvasIntegrator) -> 'SyncPlan':
+            print(f"Syncing course {integrator.course_id}...")
+            return integrator.sync_materials(dry_run=dry_run, since=since, incremental=incremental,
+                                             changes=changes)
+
+        with ThreadPoolExecutor(max_workers=len(self.integrators)) as pool:
+            futures = {i.course_id: pool.submit(sync, i) for i in self.integrators}
+        return {course_id: future.result() for course_id, future in futures.items()}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sync lecture materials to Canvas.")
+    parser.add_argument(
+        '--full-refresh',
+        action='store_true',
+        help="Re-list every file and module item instead of reconciling the state manifest.",
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help="Print the sync plan and its estimated request count without changing anything.",
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help="Instead of syncing, delete duplicate copies of lecture materials from the managed "
+             "Canvas folders (preview with --dry-run).",
+    )
+    parser.add_argument(
+        '--graphql',
+        action='store_true',
+        default=os.environ.get('CANVAS_USE_GRAPHQL', '').lower() in ('1', 'true', 'yes'),
+        help="Load modules and items through the Canvas GraphQL API, falling back to REST "
+             "(default: $CANVAS_USE_GRAPHQL).",
+    )
+    parser.add_argument(
+        '--optimize-pdfs',
+        action='store_true',
+        default=os.environ.get('CANVAS_OPTIMIZE_PDFS', '').lower() in ('1', 'true', 'yes'),
+        help="Recompress, clean up and linearize PDFs with Ghostscript (and qpdf, if installed) "
+             "before uploading them (default: $CANVAS_OPTIMIZE_PDFS).",
+    )
+    parser.add_argument(
+        '--pdf-dpi',
+        type=int,
+        default=int(os.environ.get('CANVAS_PDF_DPI', 150)),
+        help="With --optimize-pdfs, resolution to downsample embedded images to "
+             "(default: $CANVAS_PDF_DPI or 150).",
+    )
+    parser.add_argument(
+        '--since',
+        metavar='COMMIT',
+        help="Only sync files added, modified or renamed since this git commit.",
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help="Only sync files changed since the last successfully synced commit.",
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.environ.get('CANVAS_MAX_WORKERS', 4)),
+        help="Maximum concurrent uploads (default: $CANVAS_MAX_WORKERS or 4).",
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help="After the initial sync, keep running and sync files as they change.",
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=2.0,
+        help="With --watch, seconds of quiet before a burst of changes is synced (default: 2).",
+    )
+    parser.add_argument(
+        '--poll',
+        action='store_true',
+        help="With --watch, poll for changes instead of using inotify.",
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        default=os.environ.get('CANVAS_TRACE_FILE'),
+        help="Append a JSON-lines event per Canvas request and sync phase to FILE "
+             "(default: $CANVAS_TRACE_FILE).",
+    )
+    parser.add_argument(
+        '--metrics-exporter',
+        metavar='MODULE:FUNCTION',
+        default=os.environ.get('CANVAS_METRICS_EXPORTER'),
+        help="Callable that receives every trace event, e.g. mymetrics:export "
+             "(default: $CANVAS_METRICS_EXPORTER).",
+    )
+    return parser.parse_args(argv)
+
+
+def load_exporter(spec: str) -> Callable[[Dict[str, Any]], None]:
+    """Import a metrics exporter given as "module:function"."""
+    module_name, _, attr = spec.partition(':')
+    if not attr:
+        raise ValueError(f"Metrics exporter must look like module:function, got {spec!r}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
 
-def main():
     # Load .env if python-dotenv is installed
     if load_dotenv is not None:
         load_dotenv()
@@ -609,26 +2758,81 @@ def main():
     base_url = os.environ.get('CANVAS_BASE_URL', 'https://ucsb.instructure.com')
     public_site_base_url = os.environ.get('PUBLIC_SITE_BASE_URL')
     syllabus_filename = os.environ.get('SYLLABUS_FILENAME', 'syllabus.pdf')
-
-    canvas = CanvasIntegrator(
-        api_token=api_token,
-        course_id=course_id,
-        base_url=base_url,
-        public_site_base_url=public_site_base_url,
-        syllabus_filename=syllabus_filename,
+    state_dir = os.environ.get('CANVAS_STATE_DIR', '.canvas_sync')
+    exporter = load_exporter(args.metrics_exporter) if args.metrics_exporter else None
+    tracer = SyncTracer(trace_path=args.trace, exporter=exporter)
+
+    pdf_optimizer = None
+    if args.optimize_pdfs:
+        pdf_optimizer = PdfOptimizer(os.path.join(state_dir, 'pdf_cache'), dpi=args.pdf_dpi)
+        if not pdf_optimizer.available:
+            print("Ghostscript (gs) not found, uploading PDFs without optimizing them")
+            pdf_optimizer = None
+
+    # CANVAS_COURSE_ID may list several course shells, e.g. "12345,67890"
+    course_ids = [c.strip() for c in course_id.split(',') if c.strip()]
+    transport = CanvasTransport(
+        api_token,
+        pool_size=max(10, args.workers * 2 * len(course_ids)),
+        scheduler=RateLimitScheduler(args.workers),
+        tracer=tracer,
     )
+    integrators = [
+        CanvasIntegrator(
+            api_token=api_token,
+            course_id=course,
+            base_url=base_url,
+            public_site_base_url=public_site_base_url,
+            syllabus_filename=syllabus_filename,
+            state_dir=state_dir,
+            full_refresh=args.full_refresh,
+            transport=transport,
+            max_workers=args.workers,
+            tracer=tracer,
+            use_graphql=args.graphql,
+            pdf_optimizer=pdf_optimizer,
+        )
+        for course in course_ids
+    ]
+
+    if args.compact:
+        try:
+            for integrator in integrators:
+                print(f"\n==== COMPACTING COURSE {integrator.course_id} ====")
+                integrator.compact_duplicates(dry_run=args.dry_run)
+        except requests.exceptions.RequestException as e:
+            print(f"Error occurred: {e}")
+        finally:
+            transport.close()
+            tracer.print_summary()
+            tracer.close()
+        return
 
     try:
         print("\n==== STARTING CANVAS SYNC ====")
-        print(f"Course ID: {course_id}")
+        print(f"Course ID: {', '.join(course_ids)}")
         print(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        canvas.sync_materials()
+        syncer = integrators[0] if len(integrators) == 1 else CourseFanout(integrators)
+        syncer.sync_materials(dry_run=args.dry_run, since=args.since, incremental=args.incremental)
         print("\n==== SYNC COMPLETED SUCCESSFULLY ====")
         print(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
+        if args.watch:
+            # Keep the warm integrators (state, caches, connections) for every later sync
+            for integrator in integrators:
+                integrator.full_refresh = False
+            watch_materials(lambda changes: syncer.sync_materials(dry_run=args.dry_run, changes=changes),
+                            debounce=args.debounce, polling=args.poll)
+
     except requests.exceptions.RequestException as e:
         print("\n==== ERROR DURING SYNC ====")
         print(f"Error occurred: {e}")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        transport.close()
+        tracer.print_summary()
+        tracer.close()
 
 if __name__ == "__main__":
     main()